@@ -10,7 +10,7 @@ export const api = {
   },
 
   async listDevices(userId) {
-    const r = await fetch(`${API_BASE_URL}/qingping/devices?user_id=${userId}`)
+    const r = await fetch(`${API_BASE_URL}/qingping/devices?user_id=${userId}&include_devices=true`)
     if (!r.ok) throw new Error(`HTTP ${r.status}: ${await r.text()}`)
     return r.json()
   },
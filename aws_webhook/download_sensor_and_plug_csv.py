@@ -1,22 +1,24 @@
 # lambda_function.py
+import io
+import gzip
 import os
-import json
+import csv
 import time
 import uuid
-import hmac
-import hashlib
 import base64
 import logging
 from decimal import Decimal
 from typing import Dict, Any, Optional, List, Tuple
-from urllib.parse import urlencode
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, quote_plus
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 import zoneinfo
 
 import boto3
-from boto3.dynamodb.conditions import Key
+from botocore.config import Config
+from boto3.dynamodb.types import TypeDeserializer
+
+from tuya_common import tuya_request, get_tuya_token, _json_dumps
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -28,47 +30,110 @@ LOCAL_TZ = zoneinfo.ZoneInfo(os.environ.get("LOCAL_TZ", "America/New_York"))
 SENSOR_READINGS_TABLE = os.environ.get("SENSOR_READINGS_TABLE", "SensorReadings").strip()
 SENSOR_READINGS_PK = os.environ.get("SENSOR_READINGS_PK", "sensor_mac").strip()
 SENSOR_READINGS_SK = os.environ.get("SENSOR_READINGS_SK", "ts").strip()
+# metric columns exported to the CSV; anything else stored on the item is not fetched
+SENSOR_READINGS_ATTRS = [
+    a.strip()
+    for a in os.environ.get("SENSOR_READINGS_ATTRS", "pm25,pm10,co2,temperature,humidity,battery,received_at").split(",")
+    if a.strip()
+]
 
 MAPPING_TABLE = os.environ.get("TABLE_SENSOR_PLUG_MAPPING", "SensorPlugMapping").strip()
 
-# Tuya
-TUYA_ACCESS_ID = os.environ.get("TUYA_ACCESS_ID", "").strip()
-TUYA_ACCESS_SECRET = os.environ.get("TUYA_ACCESS_SECRET", "").strip()
-TUYA_BASE_URL = os.environ.get("TUYA_BASE_URL", "https://openapi.tuyaus.com").strip()
+# Large exports: when set, CSVs whose response body (base64, gzipped if the client accepts it)
+# would exceed the threshold are written to this bucket and the caller is redirected to a
+# presigned URL (Lambda caps responses at 6 MB).
+CSV_EXPORT_BUCKET = os.environ.get("CSV_EXPORT_BUCKET", "").strip()
+CSV_S3_THRESHOLD_BYTES = int(os.environ.get("CSV_S3_THRESHOLD_BYTES", str(4 * 1024 * 1024)))
+CSV_PRESIGN_EXPIRES = int(os.environ.get("CSV_PRESIGN_EXPIRES", "900"))
+
+# Tuya (credentials, signing and the token cache live in tuya_common)
 TUYA_SWITCH_CODE = os.environ.get("TUYA_SWITCH_CODE", "switch_1").strip()
 
-# Token cache
-_TUYA_TOKEN_CACHE = {"token": None, "expires_at": 0}
+# shared across warm invocations; the handler overlaps its independent I/O calls on it
+_EXECUTOR = ThreadPoolExecutor(max_workers=3)
+
+dynamodb = boto3.resource("dynamodb", config=Config(tcp_keepalive=True))
+s3 = boto3.client("s3") if CSV_EXPORT_BUCKET else None
+
+# readings are queried through a standalone low-level client so numbers decode straight to
+# int/float; the resource's meta.client would re-serialize the wire-format key values
+dynamodb_client = boto3.client("dynamodb", config=Config(tcp_keepalive=True))
+
+class _NumberDeserializer(TypeDeserializer):
+    """TypeDeserializer that returns int/float for N values instead of Decimal."""
+
+    def _deserialize_n(self, value):
+        if "." in value or "e" in value or "E" in value:
+            return float(value)
+        return int(value)
+
+_READINGS_DESERIALIZER = _NumberDeserializer()
 
-dynamodb = boto3.resource("dynamodb")
-readings_table = dynamodb.Table(SENSOR_READINGS_TABLE)
-mapping_table = dynamodb.Table(MAPPING_TABLE)
+# placeholders keep the projection safe from DynamoDB reserved words
+_READINGS_ATTR_NAMES = {
+    f"#a{i}": name
+    for i, name in enumerate([SENSOR_READINGS_PK, SENSOR_READINGS_SK] + SENSOR_READINGS_ATTRS)
+}
+_READINGS_PROJECTION = ",".join(_READINGS_ATTR_NAMES)
 
 # ---------- Helpers ----------
+_CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET,OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type,Authorization",
+}
+
 def _json_response(status: int, body: Dict[str, Any]):
     return {
         "statusCode": status,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET,OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type,Authorization",
-        },
-        "body": json.dumps(body, default=_json_default),
+        "headers": {"Content-Type": "application/json", **_CORS_HEADERS},
+        "body": _json_dumps(body, default=_json_default),
+    }
+
+def _accepts_gzip(event: dict) -> bool:
+    headers = event.get("headers") or {}
+    for k, v in headers.items():
+        if k.lower() == "accept-encoding":
+            return "gzip" in (v or "").lower()
+    return False
+
+def _csv_response(filename: str, csv_text: str, *, gzip_ok: bool = False):
+    headers = {
+        "Content-Type": "text/csv; charset=utf-8",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        **_CORS_HEADERS,
     }
+    body = csv_text.encode("utf-8")
+
+    if gzip_ok:
+        # level 1 is cheap and still shrinks CSV text several times over
+        body = gzip.compress(body, compresslevel=1)
+        headers["Content-Encoding"] = "gzip"
+
+    # the threshold applies to what would actually be returned: the chosen body, base64-encoded
+    if CSV_EXPORT_BUCKET and (len(body) + 2) // 3 * 4 > CSV_S3_THRESHOLD_BYTES:
+        key = f"csv-exports/{uuid.uuid4().hex}/{filename}"
+        extra = {"ContentEncoding": "gzip"} if gzip_ok else {}
+        s3.put_object(
+            Bucket=CSV_EXPORT_BUCKET,
+            Key=key,
+            Body=body,
+            ContentType=headers["Content-Type"],
+            ContentDisposition=headers["Content-Disposition"],
+            **extra,
+        )
+        url = s3.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": CSV_EXPORT_BUCKET, "Key": key},
+            ExpiresIn=CSV_PRESIGN_EXPIRES,
+        )
+        return {"statusCode": 302, "headers": {"Location": url, **_CORS_HEADERS}, "body": ""}
 
-def _csv_response(filename: str, csv_text: str):
     return {
         "statusCode": 200,
         "isBase64Encoded": True,
-        "headers": {
-            "Content-Type": "text/csv; charset=utf-8",
-            "Content-Disposition": f'attachment; filename="{filename}"',
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET,OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type,Authorization",
-        },
-        "body": base64.b64encode(csv_text.encode("utf-8")).decode("utf-8"),
+        "headers": headers,
+        "body": base64.b64encode(body).decode("utf-8"),
     }
 
 def _json_default(o):
@@ -88,6 +153,8 @@ def _get_qs(event: dict) -> dict:
 def _parse_time(value: str, *, is_end: bool = False) -> int:
     if value is None:
         raise ValueError("missing time")
+    if type(value) is int:
+        return value
     s = str(value).strip()
 
     # epoch seconds
@@ -96,15 +163,18 @@ def _parse_time(value: str, *, is_end: bool = False) -> int:
 
     # date-only: YYYY-MM-DD
     if len(s) == 10 and s[4] == "-" and s[7] == "-":
-        d = datetime.strptime(s, "%Y-%m-%d").date()
+        try:
+            # slicing + the C constructor is much cheaper than strptime
+            start_local = datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]), tzinfo=LOCAL_TZ)
+        except ValueError:
+            raise ValueError(f"Invalid time format: {s}")
 
         if is_end:
             # exclusive next-day midnight (local), then convert to inclusive seconds
-            end_local_excl = datetime(d.year, d.month, d.day, tzinfo=LOCAL_TZ) + timedelta(days=1)
+            end_local_excl = start_local + timedelta(days=1)
             end_utc_excl = end_local_excl.astimezone(timezone.utc)
             return int(end_utc_excl.timestamp()) - 1
         else:
-            start_local = datetime(d.year, d.month, d.day, tzinfo=LOCAL_TZ)
             start_utc = start_local.astimezone(timezone.utc)
             return int(start_utc.timestamp())
 
@@ -117,105 +187,74 @@ def _parse_time(value: str, *, is_end: bool = False) -> int:
     except Exception:
         raise ValueError(f"Invalid time format: {s}")
 
-def _sha256_hex(s: str) -> str:
-    return hashlib.sha256(s.encode("utf-8")).hexdigest()
-
-def _build_canonical_query(query: Optional[Dict[str, Any]]) -> str:
-    if not query:
-        return ""
-    cleaned = {k: v for k, v in query.items() if v is not None and str(v) != ""}
-    return urlencode(sorted(cleaned.items()), doseq=True)
-
-def _tuya_sign(method: str, path_with_query: str, body_str: str, access_token: str, t_ms: str, nonce: str) -> str:
-    content_sha256 = _sha256_hex(body_str) if body_str else hashlib.sha256(b"").hexdigest()
-    string_to_sign = f"{method.upper()}\n{content_sha256}\n\n{path_with_query}"
-    message = f"{TUYA_ACCESS_ID}{access_token}{t_ms}{nonce}{string_to_sign}"
-    return hmac.new(
-        TUYA_ACCESS_SECRET.encode("utf-8"),
-        msg=message.encode("utf-8"),
-        digestmod=hashlib.sha256,
-    ).hexdigest().upper()
-
-def _http_json(method: str, url: str, headers: dict, body_str: str = "") -> dict:
-    data = body_str.encode("utf-8") if body_str else None
-    req = Request(url, data=data, method=method.upper(), headers=headers)
-    try:
-        with urlopen(req, timeout=20) as resp:
-            raw = resp.read().decode("utf-8")
-            return json.loads(raw) if raw else {}
-    except HTTPError as e:
-        raw = e.read().decode("utf-8") if e.fp else ""
-        raise RuntimeError({"http": e.code, "body": raw})
-    except URLError as e:
-        raise RuntimeError({"http": "url_error", "body": str(e)})
-
-def tuya_request(method: str, path: str, token: str = "", query: Optional[Dict[str, Any]] = None, body: Optional[Dict[str, Any]] = None) -> dict:
-    if not TUYA_ACCESS_ID or not TUYA_ACCESS_SECRET:
-        raise RuntimeError("Missing TUYA_ACCESS_ID or TUYA_ACCESS_SECRET")
-
-    method = method.upper()
-    body_str = json.dumps(body, separators=(",", ":")) if body else ""
-    t_ms = str(int(time.time() * 1000))
-    nonce = str(uuid.uuid4())
-
-    qs = _build_canonical_query(query)
-    path_with_query = path + (f"?{qs}" if qs else "")
-
-    sign = _tuya_sign(method, path_with_query, body_str, token, t_ms, nonce)
-
-    headers = {
-        "client_id": TUYA_ACCESS_ID,
-        "sign": sign,
-        "t": t_ms,
-        "nonce": nonce,
-        "sign_method": "HMAC-SHA256",
-    }
-    if token:
-        headers["access_token"] = token
-    if body:
-        headers["Content-Type"] = "application/json"
-
-    url = TUYA_BASE_URL + path_with_query
-    data = _http_json(method, url, headers=headers, body_str=body_str)
-
-    if isinstance(data, dict) and data.get("success") is False:
-        raise RuntimeError(data)
-
-    return data
-
-def get_tuya_token() -> str:
-    now = time.time()
-    if _TUYA_TOKEN_CACHE["token"] and now < _TUYA_TOKEN_CACHE["expires_at"]:
-        return _TUYA_TOKEN_CACHE["token"]
-
-    data = tuya_request("GET", "/v1.0/token", token="", query={"grant_type": 1})
-    result = data.get("result") or {}
-    token = result.get("access_token")
-    expire_seconds = int(result.get("expire_time", 7200))
-
-    if not token:
-        raise RuntimeError({"msg": "token missing in response", "resp": data})
-
-    _TUYA_TOKEN_CACHE["token"] = token
-    _TUYA_TOKEN_CACHE["expires_at"] = now + expire_seconds - 60
-    return token
+def get_mappings(sensor_macs: List[str]) -> Dict[str, dict]:
+    """
+    BatchGetItem over SensorPlugMapping, 100 keys per request.
+    UnprocessedKeys are retried with exponential backoff; macs without a mapping are absent.
+    """
+    out: Dict[str, dict] = {}
+    macs = list(dict.fromkeys(sensor_macs))
+    for i in range(0, len(macs), 100):
+        request = {
+            MAPPING_TABLE: {
+                "Keys": [{"sensor_mac": m} for m in macs[i:i + 100]],
+                "ProjectionExpression": "sensor_mac,tuya_device_id",
+            }
+        }
+        attempt = 0
+        while request:
+            resp = dynamodb.batch_get_item(RequestItems=request)
+            for it in resp.get("Responses", {}).get(MAPPING_TABLE, []):
+                out[it["sensor_mac"]] = it
+            request = resp.get("UnprocessedKeys") or {}
+            if request:
+                if attempt >= 5:
+                    raise RuntimeError(f"BatchGetItem left {len(request[MAPPING_TABLE]['Keys'])} keys unprocessed")
+                time.sleep(0.05 * (2 ** attempt))
+                attempt += 1
+    return out
 
 def get_mapping(sensor_mac: str) -> Optional[dict]:
     try:
-        resp = mapping_table.get_item(Key={"sensor_mac": sensor_mac})
-        return resp.get("Item")
+        return get_mappings([sensor_mac]).get(sensor_mac)
     except Exception as e:
         logger.warning(f"Failed to get mapping for {sensor_mac}: {e}")
         return None
 
-def query_sensor_readings(sensor_mac: str, start_ts: int, end_ts: int) -> List[dict]:
-    key_expr = Key(SENSOR_READINGS_PK).eq(sensor_mac) & Key(SENSOR_READINGS_SK).between(start_ts, end_ts)
+def query_sensor_readings(
+    sensor_mac: str,
+    start_ts: int,
+    end_ts: int,
+    *,
+    page_size: Optional[int] = None,
+    max_items: Optional[int] = None,
+) -> List[dict]:
+    """
+    page_size maps to DynamoDB Limit (items evaluated per request);
+    max_items stops paging once that many readings have been collected.
+    """
+    deserialize = _READINGS_DESERIALIZER.deserialize
 
     items: List[dict] = []
-    kwargs = {"KeyConditionExpression": key_expr}
+    kwargs = {
+        "TableName": SENSOR_READINGS_TABLE,
+        "KeyConditionExpression": "#a0 = :pk AND #a1 BETWEEN :start AND :end",
+        "ExpressionAttributeValues": {
+            ":pk": {"S": sensor_mac},
+            ":start": {"N": str(start_ts)},
+            ":end": {"N": str(end_ts)},
+        },
+        "ProjectionExpression": _READINGS_PROJECTION,
+        "ExpressionAttributeNames": _READINGS_ATTR_NAMES,
+    }
+    if page_size:
+        kwargs["Limit"] = page_size
     while True:
-        resp = readings_table.query(**kwargs)
-        items.extend(resp.get("Items") or [])
+        resp = dynamodb_client.query(**kwargs)
+        items.extend({k: deserialize(v) for k, v in it.items()} for it in resp.get("Items") or [])
+        if max_items and len(items) >= max_items:
+            del items[max_items:]
+            break
         lek = resp.get("LastEvaluatedKey")
         if not lek:
             break
@@ -227,25 +266,28 @@ def tuya_fetch_switch_logs(token: str, tuya_device_id: str, start_ms: int, end_m
     last_row_key = ""
     size = 100
 
+    # Canonical key order is codes, end_time, last_row_key, size, start_time. Only
+    # last_row_key changes between pages, so encode the fixed parts once and splice it in.
+    head = urlencode([("codes", TUYA_SWITCH_CODE), ("end_time", end_ms)])
+    tail = urlencode([("size", size), ("start_time", start_ms)])
+    path = f"/v2.0/cloud/thing/{tuya_device_id}/report-logs"
+
     while True:
-        query = {
-            "codes": TUYA_SWITCH_CODE,
-            "start_time": start_ms,
-            "end_time": end_ms,
-            "size": size,
-        }
         if last_row_key:
-            query["last_row_key"] = last_row_key
-
-        resp = tuya_request("GET", f"/v2.0/cloud/thing/{tuya_device_id}/report-logs", token=token, query=query)
-        result = resp.get("result") or {}
-        page_logs = result.get("logs") or []
-        logs.extend(page_logs)
+            qs = f"{head}&last_row_key={quote_plus(last_row_key)}&{tail}"
+        else:
+            qs = f"{head}&{tail}"
 
-        has_more = bool(result.get("has_more"))
-        last_row_key = result.get("last_row_key") or ""
+        resp = tuya_request("GET", path, token=token, canonical_qs=qs)
+        result = resp.get("result")
+        if not result:
+            break
+        page_logs = result.get("logs")
+        if page_logs:
+            logs.extend(page_logs)
 
-        if not has_more or not last_row_key:
+        last_row_key = result.get("last_row_key")
+        if not result.get("has_more") or not last_row_key:
             break
 
     return logs
@@ -255,62 +297,49 @@ def _to_number(x):
         return int(x) if x % 1 == 0 else float(x)
     return x
 
-def _csv_escape(v) -> str:
-    if v is None:
-        return ""
-    if isinstance(v, (dict, list)):
-        v = json.dumps(v, default=_json_default)
-    v = str(_to_number(v))
-    if any(c in v for c in [",", '"', "\n", "\r"]):
-        v = '"' + v.replace('"', '""') + '"'
-    return v
+_CSV_SCALAR_TYPES = (str, int, float, bool, Decimal)
 
 def build_csv(sensor_mac: str, sensor_items: List[dict], plug_logs: List[dict]) -> str:
     """
     Output columns: source, time_iso, time_epoch_s, sensor_mac, metric, value
     """
-    rows: List[List[str]] = []
-    header = ["source", "time_iso", "time_epoch_s", "sensor_mac", "metric", "value"]
-    rows.append(header)
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    w.writerow(("source", "time_iso", "time_epoch_s", "sensor_mac", "metric", "value"))
+
+    # readings and plug logs often share the same second, so format each one once
+    iso_cache: Dict[int, str] = {}
+
+    def _iso(ts: int) -> str:
+        r = iso_cache.get(ts)
+        if r is None:
+            r = datetime.fromtimestamp(ts, tz=timezone.utc).astimezone(LOCAL_TZ).isoformat()
+            iso_cache[ts] = r
+        return r
 
     # Sensor readings
+    key_attrs = (SENSOR_READINGS_PK, SENSOR_READINGS_SK)
     for it in sensor_items:
         ts = it.get(SENSOR_READINGS_SK)
         ts_s = int(_to_number(ts)) if ts is not None else None
-        time_iso = datetime.fromtimestamp(ts_s, tz=timezone.utc).astimezone(LOCAL_TZ).isoformat() if ts_s else ""
-        for k, v in it.items():
-            if k in (SENSOR_READINGS_PK, SENSOR_READINGS_SK):
-                continue
-            if isinstance(v, (str, int, float, bool, Decimal)):
-                rows.append([
-                    "sensor",
-                    time_iso,
-                    str(ts_s or ""),
-                    sensor_mac,
-                    k,
-                    str(_to_number(v)),
-                ])
+        time_iso = _iso(ts_s) if ts_s else ""
+        w.writerows(
+            ("sensor", time_iso, ts_s or "", sensor_mac, k, _to_number(v))
+            for k, v in it.items()
+            if k not in key_attrs and isinstance(v, _CSV_SCALAR_TYPES)
+        )
 
     # Plug logs (only if available)
-    for lg in plug_logs:
-        event_ms = lg.get("event_time")
-        event_s = int(int(event_ms) / 1000) if event_ms else None
-        time_iso = datetime.fromtimestamp(event_s, tz=timezone.utc).astimezone(LOCAL_TZ).isoformat() if event_s else ""
-        code = lg.get("code") or TUYA_SWITCH_CODE
-        val = lg.get("value")
-        rows.append([
-            "plug",
-            time_iso,
-            str(event_s or ""),
-            sensor_mac,
-            code,
-            str(val),
-        ])
-
-    lines = []
-    for r in rows:
-        lines.append(",".join(_csv_escape(x) for x in r))
-    return "\n".join(lines) + "\n"
+    def _plug_rows():
+        for lg in plug_logs:
+            event_ms = lg.get("event_time")
+            event_s = int(int(event_ms) / 1000) if event_ms else None
+            time_iso = _iso(event_s) if event_s else ""
+            yield ("plug", time_iso, event_s or "", sensor_mac, lg.get("code") or TUYA_SWITCH_CODE, str(lg.get("value")))
+
+    w.writerows(_plug_rows())
+
+    return buf.getvalue()
 
 # ---------- Lambda handler ----------
 def lambda_handler(event, context):
@@ -336,9 +365,17 @@ def lambda_handler(event, context):
         if end_ts < start_ts:
             return _json_response(400, {"status": "error", "message": "end_time must be >= start_time"})
 
+        # The readings query and mapping lookup are independent, so start them together.
+        # The Tuya token is only fetched once the mapping names a plug, still overlapping
+        # the readings query.
+        f_items = _EXECUTOR.submit(query_sensor_readings, sensor_mac, start_ts, end_ts)
+        f_map = _EXECUTOR.submit(get_mapping, sensor_mac)
+        mapping = f_map.result()
+        f_tok = _EXECUTOR.submit(get_tuya_token) if mapping and mapping.get("tuya_device_id") else None
+
         # 1) Query sensor readings (ALWAYS)
-        sensor_items = query_sensor_readings(sensor_mac, start_ts, end_ts)
-        
+        sensor_items = f_items.result()
+
         # If no sensor data found, return error
         if not sensor_items:
             return _json_response(404, {
@@ -349,15 +386,14 @@ def lambda_handler(event, context):
                 "end_time": end_time
             })
 
-        # 2) Try to find mapping and fetch plug logs (OPTIONAL)
+        # 2) Fetch plug logs when a mapping exists (OPTIONAL)
         plug_logs = []
-        mapping = get_mapping(sensor_mac)
-        
-        if mapping and mapping.get("tuya_device_id"):
+
+        if f_tok is not None:
             # Mapping exists - try to fetch plug logs
             tuya_device_id = mapping["tuya_device_id"]
             try:
-                token = get_tuya_token()
+                token = f_tok.result()
                 plug_logs = tuya_fetch_switch_logs(token, tuya_device_id, start_ms=start_ts * 1000, end_ms=end_ts * 1000)
                 logger.info(f"Fetched {len(plug_logs)} plug logs for {sensor_mac}")
             except Exception as e:
@@ -370,7 +406,7 @@ def lambda_handler(event, context):
         csv_text = build_csv(sensor_mac, sensor_items, plug_logs)
         filename = f"sensor_{sensor_mac}_{start_time}_{end_time}.csv"
 
-        return _csv_response(filename, csv_text)
+        return _csv_response(filename, csv_text, gzip_ok=_accepts_gzip(event))
 
     except Exception as e:
         logger.exception("download csv failed")
@@ -1,32 +1,38 @@
-import json
-import uuid
 import os
 import hmac
-import hashlib
 import logging
-import requests
 import time
 from datetime import datetime, timedelta
-import boto3
 from decimal import Decimal
 from typing import Optional
 import base64
 
+from tuya_common import tuya_request, get_tuya_token, _json_dumps, _json_loads
+
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+# LOG_LEVEL=DEBUG brings back full payload and Tuya response logging
+_LOG_LEVEL = logging.getLevelName(os.environ.get("LOG_LEVEL", "INFO").upper())
+# an unknown name comes back as a "Level X" string; fall back rather than fail INIT
+logger.setLevel(_LOG_LEVEL if isinstance(_LOG_LEVEL, int) else logging.INFO)
 
 # dev mode
 SKIP_QINGPING_SIG_VERIFY = os.environ.get("SKIP_QINGPING_SIG_VERIFY", "false").lower() == "true"
 DRY_RUN = os.environ.get("DRY_RUN", "false").lower() == "true"
+# bodies above this are rejected unparsed; a real push is a few KB even with a backlog of readings
+MAX_WEBHOOK_BODY_BYTES = int(os.environ.get("MAX_WEBHOOK_BODY_BYTES", str(256 * 1024)))
 
 # Qingping
 APP_SECRET = os.environ.get("QINGPING_APP_SECRET", "").strip()
+_APP_SECRET_BYTES = APP_SECRET.encode("utf-8")
+
+# Tuya credentials, signing and the token cache live in tuya_common
 
-# Tuya
-ACCESS_ID = os.environ.get("TUYA_ACCESS_ID", "").strip()
-ACCESS_SECRET = os.environ.get("TUYA_ACCESS_SECRET", "").strip()
-BASE_URL = "https://openapi.tuyaus.com"
-_TUYA_TOKEN_CACHE = {"token": None, "expires_at": 0}
+# fixed responses for the common paths, serialized once (never mutate these)
+_OK = {"statusCode": 200, "body": '{"status":"ok"}'}
+_OK_ALIVE = {"statusCode": 200, "body": '{"status":"alive"}'}
+_OK_NOOP = {"statusCode": 200, "body": '{"status":"ok","message":"no data"}'}
+_UNAUTHORIZED = {"statusCode": 401, "body": '{"status":"unauthorized"}'}
+_TOO_LARGE = {"statusCode": 413, "body": '{"status":"error","message":"body too large"}'}
 
 # signature verification
 def _verify_signature(signature_block: dict) -> bool:
@@ -36,24 +42,99 @@ def _verify_signature(signature_block: dict) -> bool:
         sig = signature_block.get("signature", "")
         if not (APP_SECRET and ts and token and sig):
             return False
-        expected = hmac.new(APP_SECRET.encode("utf-8"),
-                            (ts + token).encode("utf-8"),
-                            hashlib.sha256).hexdigest()
-        return hmac.compare_digest(expected, sig)
+        try:
+            provided = bytes.fromhex(sig)
+        except ValueError:
+            return False
+        # compare raw digests; skips building a hex string per webhook
+        expected = hmac.digest(_APP_SECRET_BYTES, (ts + token).encode("utf-8"), "sha256")
+        return hmac.compare_digest(expected, provided)
     except Exception as e:
-        logger.error(f"signature verify error: {e}")
+        logger.error("signature verify error: %s", e)
         return False
     
 # creating DynamoDB handles
-dynamodb = boto3.resource("dynamodb")
 TABLE_SENSOR_READINGS = os.environ.get("TABLE_SENSOR_READINGS", "SensorReadings")
 TABLE_SENSOR_PLUG_MAPPING = os.environ.get("TABLE_SENSOR_PLUG_MAPPING", "SensorPlugMapping")
 TABLE_QINGPING_DEVICES = os.environ.get("TABLE_QINGPING_DEVICES", "QingpingDevices")
 SHARED_USER_ID = os.environ.get("SHARED_USER_ID", "qingping_shared")
+# keep only the newest reading of each push (one write) instead of the full history
+STORE_LATEST_ONLY = os.environ.get("STORE_LATEST_ONLY", "false").lower() == "true"
+
+# optional: when set, plug commands are queued here and sent by the SQS-triggered invocation
+TUYA_CONTROL_QUEUE_URL = os.environ.get("TUYA_CONTROL_QUEUE_URL", "").strip()
+
+# boto3 is imported on first use so the health-check and manual paths skip its import cost
+dynamodb = None
+_TABLES = {}
+
+def _get_dynamodb():
+    global dynamodb
+    if dynamodb is None:
+        import boto3
+        from botocore.config import Config
+        dynamodb = boto3.resource("dynamodb", config=Config(tcp_keepalive=True))
+    return dynamodb
+
+def _get_table(name: str):
+    table = _TABLES.get(name)
+    if table is None:
+        table = _TABLES[name] = _get_dynamodb().Table(name)
+    return table
+
+_client = None
+
+def _get_client():
+    # a standalone client for the wire-format reading writes; the resource's meta.client
+    # would run its TypeSerializer over the already-typed items again
+    global _client
+    if _client is None:
+        import boto3
+        from botocore.config import Config
+        _client = boto3.client("dynamodb", config=Config(tcp_keepalive=True))
+    return _client
+
+_sqs = None
+
+def _get_sqs():
+    global _sqs
+    if _sqs is None:
+        import boto3
+        _sqs = boto3.client("sqs")
+    return _sqs
+
+# PREWARM_DYNAMODB_ON_INIT=true warms the DynamoDB client during Lambda INIT: one cheap GetItem
+# resolves credentials and the endpoint and opens the TLS connection before the first
+# billed request. Off by default, since it means importing boto3 at INIT, which the lazy
+# handles above exist to avoid. tuya_common's HTTP prewarm has its own switch,
+# PREWARM_TUYA_ON_INIT, and needs no boto3.
+PREWARM_DYNAMODB_ON_INIT = os.environ.get("PREWARM_DYNAMODB_ON_INIT", "false").lower() == "true"
+
+def _prewarm_dynamodb():
+    # the mapping lookup goes through the resource, the reading writes through their own client;
+    # each is warmed separately so one failing GetItem does not leave the other cold
+    try:
+        _get_table(TABLE_SENSOR_PLUG_MAPPING).get_item(Key={"sensor_mac": "__prewarm__"})
+    except Exception as e:
+        logger.info("DynamoDB resource prewarm skipped: %s", e)
+    try:
+        _get_client().get_item(
+            TableName=TABLE_SENSOR_READINGS, Key={"sensor_mac": {"S": "__prewarm__"}, "ts": {"N": "0"}}
+        )
+    except Exception as e:
+        logger.info("DynamoDB client prewarm skipped: %s", e)
+
+if PREWARM_DYNAMODB_ON_INIT and os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+    _prewarm_dynamodb()
 
-readings_table = dynamodb.Table(TABLE_SENSOR_READINGS)
-mapping_table = dynamodb.Table(TABLE_SENSOR_PLUG_MAPPING)
-devices_table = dynamodb.Table(TABLE_QINGPING_DEVICES)
+def _event_body_too_large(event: dict) -> bool:
+    """Checks the raw body against MAX_WEBHOOK_BODY_BYTES before anything is decoded."""
+    raw = event.get("body") or ""
+    if event.get("isBase64Encoded"):
+        # 4 base64 characters carry 3 bytes
+        return len(raw) // 4 * 3 > MAX_WEBHOOK_BODY_BYTES
+    # a character is at least one UTF-8 byte, so only bodies under the cap need encoding
+    return len(raw) > MAX_WEBHOOK_BODY_BYTES or len(raw.encode("utf-8")) > MAX_WEBHOOK_BODY_BYTES
 
 def _get_event_body_str(event: dict) -> str:
     body = event.get("body") or ""
@@ -65,24 +146,79 @@ def _get_event_body_str(event: dict) -> str:
     return body
 
 # save sensor reading
-def save_sensor_reading(sensor_mac: str, reading: dict):
+def _N(v) -> dict:
+    # DynamoDB wire number; ints and floats are already valid numeric strings
+    if isinstance(v, int):
+        return {"N": str(v)}
+    if isinstance(v, float):
+        return {"N": repr(v)}
+    return {"N": str(Decimal(str(v)))}
+
+_EMPTY = {}
+
+def _v(reading: dict, key: str):
+    # a metric's "value"; the shared default avoids a throwaway {} per lookup
+    return reading.get(key, _EMPTY).get("value", 0)
+
+def _reading_template(sensor_mac: str) -> dict:
+    # fields shared by every reading of one webhook, already in wire format
+    return {"sensor_mac": {"S": sensor_mac}, "received_at": {"N": str(int(time.time()))}}
+
+def _build_reading_item(template: dict, reading: dict) -> dict:
+    # a copy per reading: a batch holds a reference to each item until it is sent
+    item = template.copy()
     # reading["timestamp"]["value"] is seconds in your payload
-    ts_sec = int(reading.get("timestamp", {}).get("value", 0))
-    item = {
-        "sensor_mac": sensor_mac,
-        "ts": ts_sec,  # your DynamoDB sort key (Number)
-        "pm25": Decimal(str(reading.get("pm25", {}).get("value", 0))),
-        "pm10": Decimal(str(reading.get("pm10", {}).get("value", 0))),
-        "co2": Decimal(str(reading.get("co2", {}).get("value", 0))),
-        "temperature": Decimal(str(reading.get("temperature", {}).get("value", 0))),
-        "humidity": Decimal(str(reading.get("humidity", {}).get("value", 0))),
-        "battery": Decimal(str(reading.get("battery", {}).get("value", 0))),
-        "received_at": int(time.time())
-    }
+    item["ts"] = {"N": str(int(_v(reading, "timestamp")))}  # your DynamoDB sort key (Number)
+    item["pm25"] = _N(_v(reading, "pm25"))
+    item["pm10"] = _N(_v(reading, "pm10"))
+    item["co2"] = _N(_v(reading, "co2"))
+    item["temperature"] = _N(_v(reading, "temperature"))
+    item["humidity"] = _N(_v(reading, "humidity"))
+    item["battery"] = _N(_v(reading, "battery"))
+    return item
+
+def save_sensor_reading(sensor_mac: str, reading: dict):
+    item = _build_reading_item(_reading_template(sensor_mac), reading)
+    try:
+        _get_client().put_item(TableName=TABLE_SENSOR_READINGS, Item=item)
+    except Exception as e:
+        logger.error("DynamoDB put_item failed for %s ts=%s: %s", sensor_mac, item["ts"]["N"], e)
+
+def _batch_write_readings(items: list):
+    """
+    BatchWriteItem, 25 puts per request.
+    UnprocessedItems are retried with exponential backoff.
+    """
+    client = _get_client()
+    for i in range(0, len(items), 25):
+        request = {TABLE_SENSOR_READINGS: [{"PutRequest": {"Item": it}} for it in items[i:i + 25]]}
+        attempt = 0
+        while request:
+            resp = client.batch_write_item(RequestItems=request)
+            request = resp.get("UnprocessedItems") or {}
+            if request:
+                if attempt >= 5:
+                    raise RuntimeError(f"BatchWriteItem left {len(request[TABLE_SENSOR_READINGS])} items unprocessed")
+                time.sleep(0.05 * (2 ** attempt))
+                attempt += 1
+
+def save_sensor_readings(sensor_mac: str, data_list: list):
+    """
+    Writes every reading of a webhook with BatchWriteItem (one put_item for a single reading).
+    """
+    if len(data_list) == 1:
+        save_sensor_reading(sensor_mac, data_list[0])
+        return
+    template = _reading_template(sensor_mac)
+    # keyed by ts: BatchWriteItem rejects duplicate keys in one request, and the last reading wins
+    by_ts = {}
+    for reading in data_list:
+        item = _build_reading_item(template, reading)
+        by_ts[item["ts"]["N"]] = item
     try:
-        readings_table.put_item(Item=item)
+        _batch_write_readings(list(by_ts.values()))
     except Exception as e:
-        logger.error(f"DynamoDB put_item failed for {sensor_mac} ts={ts_sec}: {e}")
+        logger.error("DynamoDB batch write failed for %s (%d readings): %s", sensor_mac, len(data_list), e)
 
 def upsert_qingping_device(info: dict, user_id: str = "qingping_shared"):
     """
@@ -113,12 +249,17 @@ def upsert_qingping_device(info: dict, user_id: str = "qingping_shared"):
     }
 
     # If you want "bound_at" only on first insert, use UpdateExpression instead.
-    devices_table.put_item(Item=item)
+    _get_table(TABLE_QINGPING_DEVICES).put_item(Item=item)
 
 # lookup plug for a sensor
 def get_plug_device_id_for_sensor(sensor_mac: str) -> Optional[str]:
     try:
-        resp = mapping_table.get_item(Key={"sensor_mac": sensor_mac})
+        # only the two attributes used below; skips shipping and unmarshalling the rest
+        resp = _get_table(TABLE_SENSOR_PLUG_MAPPING).get_item(
+            Key={"sensor_mac": sensor_mac},
+            ProjectionExpression="#en, #dev",
+            ExpressionAttributeNames={"#en": "enabled", "#dev": "tuya_device_id"},
+        )
         item = resp.get("Item")
 
         if item and item.get("enabled", True):
@@ -126,35 +267,33 @@ def get_plug_device_id_for_sensor(sensor_mac: str) -> Optional[str]:
 
         return None
     except Exception as e:
-        logger.error(f"DynamoDB get_item failed for mapping {sensor_mac}: {e}")
+        logger.error("DynamoDB get_item failed for mapping %s: %s", sensor_mac, e)
         return None
 
 # detect qingping payload
-def _is_qingping_webhook(event: dict) -> bool:
-    body = _get_event_body_str(event)
-    if not body or body == "":
-        return False
+def _try_parse_qingping(body: str) -> Optional[dict]:
+    """Returns the parsed webhook body when it is a Qingping push, else None."""
+    # cheap substring test first: bodies that cannot be a push are never parsed
+    if '"signature"' not in body:
+        return None
     try:
-        payload = json.loads(body)
+        payload = _json_loads(body)
     except Exception:
-        return False
-    return isinstance(payload, dict) and "signature" in payload and "payload" in payload
+        return None
+    if isinstance(payload, dict) and "signature" in payload and "payload" in payload:
+        return payload
+    return None
 
 # saves data and later controls the right plug
-def handle_qingping_webhook(event):
-    body = _get_event_body_str(event)
-    try:
-        payload = json.loads(body)
-    except Exception as e:
-        logger.error(f"bad json: {e}")
-        return {"statusCode": 400, "body": json.dumps({"status": "error", "message": "invalid json"})}
-
-    logger.info("Incoming Qingping Data: %s", json.dumps(payload, ensure_ascii=False))
+def handle_qingping_webhook(payload: dict):
+    # the dump is skipped entirely unless DEBUG is on
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Incoming Qingping Data: %s", _json_dumps(payload))
 
     if not SKIP_QINGPING_SIG_VERIFY:
         sig_block = payload.get("signature", {})
         if not _verify_signature(sig_block):
-            return {"statusCode": 401, "body": json.dumps({"status": "unauthorized"})}
+            return _UNAUTHORIZED
     else:
         logger.info("Skipping Qingping signature verification (dev mode)")
     
@@ -163,180 +302,128 @@ def handle_qingping_webhook(event):
     data_list = payload.get("payload", {}).get("data", [])
     upsert_qingping_device(info, user_id=SHARED_USER_ID)
     if not sensor_mac or not data_list:
-        return {"statusCode": 200, "body": json.dumps({"status": "ok", "message": "no data"})}
+        return _OK_NOOP
+    logger.info("Qingping webhook for %s: %d readings", sensor_mac, len(data_list))
 
     # Save ALL readings (or just latest — your choice)
-    for reading in data_list:
-        save_sensor_reading(sensor_mac, reading)
+    if STORE_LATEST_ONLY:
+        save_sensor_reading(sensor_mac, data_list[-1])
+    else:
+        save_sensor_readings(sensor_mac, data_list)
 
     latest = data_list[-1]
-    pm25 = float(latest.get("pm25", {}).get("value", 0))
-    logger.info(f"Saved readings for {sensor_mac}. Latest pm25={pm25}")
+    pm25 = float(_v(latest, "pm25"))
+    logger.info("Saved readings for %s. Latest pm25=%s", sensor_mac, pm25)
 
     # OPTIONAL: control plug if mapping exists
     plug_device_id = get_plug_device_id_for_sensor(sensor_mac)
     if plug_device_id:
         state = pm25 >= 9
-        logger.info(f"Mapped plug found: {plug_device_id}. Setting switch={state}")
+        logger.info("Mapped plug found: %s. Setting switch=%s", plug_device_id, state)
 
         if DRY_RUN:
             logger.info("DRY_RUN enabled → skipping Tuya control call")
+        elif TUYA_CONTROL_QUEUE_URL:
+            # ack Qingping now; the token fetch and command run off the webhook path
+            try:
+                enqueue_plug_control(plug_device_id, state)
+            except Exception as e:
+                logger.error("Queueing Tuya control failed for %s: %s", plug_device_id, e)
         else:
             try:
                 control_plug(plug_device_id, state)
             except Exception as e:
-                logger.error(f"Tuya control failed for {plug_device_id}: {e}")
+                logger.error("Tuya control failed for %s: %s", plug_device_id, e)
     else:
-        logger.info(f"No plug mapping found for sensor {sensor_mac} (skipping control)")
+        logger.info("No plug mapping found for sensor %s (skipping control)", sensor_mac)
 
-    return {"statusCode": 200, "body": json.dumps({"status": "ok"})}
+    return _OK
 
 def convert_tuya_timestamp_to_utc_minus_5(ms: int) -> str:
     utc_dt = datetime.utcfromtimestamp(ms / 1000.0)
     est_dt = utc_dt - timedelta(hours=5)   # fixed UTC-5 (no DST handling)
     return est_dt.strftime("%Y-%m-%d %I:%M:%S %p (UTC-5)")
 
-# tuya Control 
-def get_tuya_token():
-    now = time.time()
-
-    # Reuse token if still valid
-    if _TUYA_TOKEN_CACHE["token"] and now < _TUYA_TOKEN_CACHE["expires_at"]:
-        return _TUYA_TOKEN_CACHE["token"]
-
-    # 1. Generate timestamp and nonce
-    t = str(int(time.time() * 1000))
-    nonce = str(uuid.uuid4())
-
-    # 2. Build stringToSign
-    content_sha256 = hashlib.sha256(b"").hexdigest()
-    string_to_sign = "GET\n" + content_sha256 + "\n\n" + "/v1.0/token?grant_type=1"
-
-    # 3. Build full string to hash
-    message = ACCESS_ID + t + nonce + string_to_sign
-
-    # 4. Compute signature
-    sign = hmac.new(
-        ACCESS_SECRET.encode("utf-8"),
-        msg=message.encode("utf-8"),
-        digestmod=hashlib.sha256
-    ).hexdigest().upper()
-
-    headers = {
-        "client_id": ACCESS_ID,
-        "sign": sign,
-        "t": t,
-        "nonce": nonce,
-        "sign_method": "HMAC-SHA256",
-    }
-
-    url = f"{BASE_URL}/v1.0/token?grant_type=1"
-    r = requests.get(url, headers=headers, timeout=10)
-    logger.info(f"Raw token response: {r.text}")
-    r.raise_for_status()
-    resp = r.json()
-
-    if not resp.get("success"):
-        raise Exception(f"Tuya auth failed: {json.dumps(resp)}")
-
-    token = resp["result"]["access_token"]
-    expire_seconds = int(resp["result"].get("expire_time", 7200))
-
-    # Cache token (refresh 60s early)
-    _TUYA_TOKEN_CACHE["token"] = token
-    _TUYA_TOKEN_CACHE["expires_at"] = now + expire_seconds - 60
-
-    return token
-
+# tuya Control
 def control_plug(device_id: str, state: bool):
     token = get_tuya_token()
-    t = str(int(time.time() * 1000))
-    nonce = str(uuid.uuid4())
-
     data = {"commands": [{"code": "switch_1", "value": state}]}
-    body_str = json.dumps(data, separators=(",", ":"))
-    content_sha256 = hashlib.sha256(body_str.encode("utf-8")).hexdigest()
-
-    path = f"/v1.0/devices/{device_id}/commands"
-    string_to_sign = "POST\n" + content_sha256 + "\n\n" + path
-    message = ACCESS_ID + token + t + nonce + string_to_sign
-
-    sign = hmac.new(ACCESS_SECRET.encode("utf-8"), msg=message.encode("utf-8"), digestmod=hashlib.sha256).hexdigest().upper()
-
-    headers = {
-        "client_id": ACCESS_ID,
-        "access_token": token,
-        "sign": sign,
-        "t": t,
-        "nonce": nonce,
-        "sign_method": "HMAC-SHA256",
-        "Content-Type": "application/json",
-    }
+    resp = tuya_request("POST", f"/v1.0/devices/{device_id}/commands", token=token, body=data, check_success=False)
+    logger.debug("Tuya control response: %s", resp)
+    return resp
 
-    url = BASE_URL + path
-    r = requests.post(url, headers=headers, data=body_str, timeout=10)
-    logger.info(f"Tuya control response: {r.text}")
-    r.raise_for_status()
-    return r.json()
+def enqueue_plug_control(device_id: str, state: bool):
+    _get_sqs().send_message(
+        QueueUrl=TUYA_CONTROL_QUEUE_URL,
+        MessageBody=_json_dumps({"device_id": device_id, "state": state}),
+    )
+
+def _is_sqs_event(event: dict) -> bool:
+    records = event.get("Records")
+    return bool(records) and records[0].get("eventSource") == "aws:sqs"
+
+def handle_plug_control_queue(event: dict):
+    """
+    Sends queued plug commands. Failed messages are reported back so SQS
+    retries only those (needs ReportBatchItemFailures on the event source mapping).
+    """
+    failures = []
+    for record in event["Records"]:
+        try:
+            msg = _json_loads(record["body"])
+            control_plug(msg["device_id"], bool(msg["state"]))
+        except Exception as e:
+            logger.error("Queued Tuya control failed (%s): %s", record.get("messageId"), e)
+            failures.append({"itemIdentifier": record.get("messageId")})
+    return {"batchItemFailures": failures}
 
 def lambda_handler(event, context):
 
     # 1) Qingping webhook (real events)
-    if _is_qingping_webhook(event):
-        return handle_qingping_webhook(event)
+    if _event_body_too_large(event):
+        return _TOO_LARGE
+    body = _get_event_body_str(event)
+    if body:
+        payload = _try_parse_qingping(body)
+        if payload is not None:
+            return handle_qingping_webhook(payload)
 
-    # 2) Manual demo / AWS test event
+    # 2) Plug commands queued by the webhook (SQS trigger)
+    if _is_sqs_event(event):
+        return handle_plug_control_queue(event)
+
+    # 3) Manual demo / AWS test event
     if event.get("manual_on") or event.get("manual_off") or event.get("read_status"):
         return handle_manual(event)
 
-    # 3) default (health check)
-    return {"statusCode": 200, "body": json.dumps({"status": "alive"})}
+    # 4) default (health check)
+    return _OK_ALIVE
 
 def handle_manual(event):
     # device id for manual control
     device_id = event.get("device_id") or os.environ.get("TUYA_DEVICE_ID", "").strip()
     if not device_id:
-        return {"statusCode": 400, "body": json.dumps({"status": "error", "message": "missing device_id"})}
+        return {"statusCode": 400, "body": _json_dumps({"status": "error", "message": "missing device_id"})}
 
     if event.get("manual_on"):
         logger.info("MANUAL DEMO → Turning plug ON")
-        return {"statusCode": 200, "body": json.dumps(control_plug(device_id, True))}
+        return {"statusCode": 200, "body": _json_dumps(control_plug(device_id, True))}
 
     if event.get("manual_off"):
         logger.info("MANUAL DEMO → Turning plug OFF")
-        return {"statusCode": 200, "body": json.dumps(control_plug(device_id, False))}
+        return {"statusCode": 200, "body": _json_dumps(control_plug(device_id, False))}
 
     if event.get("read_status"):
         logger.info("Reading plug status")
         result = read_plug_status(device_id)
         if result.get("success") and "t" in result:
-            logger.info(f"Tuya server time (UTC-5): {convert_tuya_timestamp_to_utc_minus_5(result['t'])}")
-        return {"statusCode": 200, "body": json.dumps(result)}
+            logger.info("Tuya server time (UTC-5): %s", convert_tuya_timestamp_to_utc_minus_5(result["t"]))
+        return {"statusCode": 200, "body": _json_dumps(result)}
     
-    return {"statusCode": 200, "body": json.dumps({"status": "no manual command detected"})}
+    return {"statusCode": 200, "body": _json_dumps({"status": "no manual command detected"})}
 
 def read_plug_status(device_id: str):
     token = get_tuya_token()
-    t = str(int(time.time() * 1000))
-    nonce = str(uuid.uuid4())
-
-    content_sha256 = hashlib.sha256(b"").hexdigest()
-    path = f"/v1.0/devices/{device_id}/status"
-    string_to_sign = "GET\n" + content_sha256 + "\n\n" + path
-    message = ACCESS_ID + token + t + nonce + string_to_sign
-
-    sign = hmac.new(ACCESS_SECRET.encode("utf-8"), msg=message.encode("utf-8"), digestmod=hashlib.sha256).hexdigest().upper()
-
-    headers = {
-        "client_id": ACCESS_ID,
-        "access_token": token,
-        "sign": sign,
-        "t": t,
-        "nonce": nonce,
-        "sign_method": "HMAC-SHA256",
-    }
-
-    r = requests.get(BASE_URL + path, headers=headers, timeout=10)
-    logger.info(f"Plug status response: {r.text}")
-    r.raise_for_status()
-    return r.json()
\ No newline at end of file
+    resp = tuya_request("GET", f"/v1.0/devices/{device_id}/status", token=token, check_success=False)
+    logger.debug("Plug status response: %s", resp)
+    return resp
@@ -6,15 +6,29 @@ import logging
 from typing import Dict, Any, Optional
 from decimal import Decimal
 
-import boto3
+try:
+    import orjson
+except ImportError:  # not bundled with this deployment; use the stdlib codec
+    orjson = None
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 # DynamoDB table (SensorPlugMapping)
 TABLE_SENSOR_PLUG_MAPPING = os.environ.get("TABLE_SENSOR_PLUG_MAPPING", "SensorPlugMapping").strip()
-dynamodb = boto3.resource("dynamodb")
-mapping_table = dynamodb.Table(TABLE_SENSOR_PLUG_MAPPING)
+# boto3 is imported lazily; validation errors return without loading it
+dynamodb = None
+_TABLES = {}
+
+def _get_table(name: str):
+    global dynamodb
+    table = _TABLES.get(name)
+    if table is None:
+        if dynamodb is None:
+            import boto3
+            dynamodb = boto3.resource("dynamodb")
+        table = _TABLES[name] = dynamodb.Table(name)
+    return table
 
 def _json_default(o):
     if isinstance(o, Decimal):
@@ -22,11 +36,21 @@ def _json_default(o):
         return int(o) if o % 1 == 0 else float(o)
     raise TypeError(f"Object of type {o.__class__.__name__} is not JSON serializable")
 
+def _json_dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), default=_json_default)
+
+def _json_loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 def _json_response(status: int, body: Dict[str, Any]):
     return {
         "statusCode": status,
         "headers": {"Content-Type": "application/json"},
-        "body": json.dumps(body, default=_json_default),
+        "body": _json_dumps(body),
     }
 
 def _get_event_body_json(event: dict) -> dict:
@@ -51,7 +75,7 @@ def _get_event_body_json(event: dict) -> dict:
 
     if isinstance(body, str):
         try:
-            return json.loads(body)
+            return _json_loads(body)
         except Exception:
             return {}
 
@@ -90,31 +114,23 @@ def upsert_mapping(sensor_mac: str, tuya_device_id: str, enabled: bool, user_id:
     """
     now = int(time.time())
 
-    # Check existing to preserve created_at if present
-    existing = {}
-    try:
-        resp = mapping_table.get_item(Key={"sensor_mac": sensor_mac})
-        existing = resp.get("Item") or {}
-    except Exception as e:
-        logger.warning("get_item failed (continuing): %s", e)
-
-    item = {
-        "sensor_mac": sensor_mac,
-        "tuya_device_id": tuya_device_id,
-        "enabled": enabled,
-        "updated_at": now,
-    }
-
-    if "created_at" in existing:
-        item["created_at"] = existing["created_at"]
-    else:
-        item["created_at"] = now
-
+    # one conditional write: if_not_exists keeps created_at on updates, no read first
+    sets = ["#dev = :d", "#en = :e", "#upd = :n", "#cre = if_not_exists(#cre, :n)"]
+    names = {"#dev": "tuya_device_id", "#en": "enabled", "#upd": "updated_at", "#cre": "created_at"}
+    values = {":d": tuya_device_id, ":e": enabled, ":n": now}
     if user_id:
-        item["user_id"] = user_id
-
-    mapping_table.put_item(Item=item)
-    return item
+        sets.append("#uid = :u")
+        names["#uid"] = "user_id"
+        values[":u"] = user_id
+
+    resp = _get_table(TABLE_SENSOR_PLUG_MAPPING).update_item(
+        Key={"sensor_mac": sensor_mac},
+        UpdateExpression="SET " + ", ".join(sets),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ReturnValues="ALL_NEW",
+    )
+    return resp.get("Attributes") or {}
 
 def lambda_handler(event, context):
     """
@@ -143,7 +159,7 @@ def lambda_handler(event, context):
             return _json_response(400, {"status": "error", "message": "Missing sensor_mac"})
 
         if delete_flag:
-            mapping_table.delete_item(Key={"sensor_mac": sensor_mac})
+            _get_table(TABLE_SENSOR_PLUG_MAPPING).delete_item(Key={"sensor_mac": sensor_mac})
             return _json_response(200, {"status": "ok", "message": "deleted", "sensor_mac": sensor_mac})
 
         tuya_device_id = (body.get("tuya_device_id") or "").strip()
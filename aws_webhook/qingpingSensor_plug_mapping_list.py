@@ -5,8 +5,10 @@ import logging
 from decimal import Decimal
 from typing import Any, Dict
 
-import boto3
-from boto3.dynamodb.conditions import Key
+try:
+    import orjson
+except ImportError:  # not bundled with this deployment; use the stdlib codec
+    orjson = None
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -14,18 +16,54 @@ logger.setLevel(logging.INFO)
 TABLE_SENSOR_PLUG_MAPPING = os.environ.get("TABLE_SENSOR_PLUG_MAPPING", "SensorPlugMapping").strip()
 MAPPING_GSI_USER_ID = os.environ.get("MAPPING_GSI_USER_ID", "gsi_user_id").strip()
 
-dynamodb = boto3.resource("dynamodb")
-mapping_table = dynamodb.Table(TABLE_SENSOR_PLUG_MAPPING)
+# attributes returned to the UI; placeholders keep the projection clear of reserved words
+_MAPPING_FIELDS = ("user_id", "sensor_mac", "tuya_device_id", "enabled", "created_at", "updated_at")
+_MAPPING_ATTR_NAMES = {f"#f{i}": name for i, name in enumerate(_MAPPING_FIELDS)}
+_MAPPING_PROJECTION = ", ".join(_MAPPING_ATTR_NAMES)
+
+# boto3 loads on first use, so CORS preflights never import it
+dynamodb = None
+_TABLES = {}
+
+def _get_table(name: str):
+    global dynamodb
+    table = _TABLES.get(name)
+    if table is None:
+        if dynamodb is None:
+            import boto3
+            dynamodb = boto3.resource("dynamodb")
+        table = _TABLES[name] = dynamodb.Table(name)
+    return table
+
+# opt-in: open the DynamoDB connection during INIT (a denied GetItem still does the
+# handshake); left off, a cold start serving a CORS preflight never imports boto3
+PREWARM_DYNAMODB_ON_INIT = os.environ.get("PREWARM_DYNAMODB_ON_INIT", "false").lower() == "true"
+
+def _prewarm_dynamodb(table):
+    try:
+        table.get_item(Key={"sensor_mac": "__prewarm__"})
+    except Exception as e:
+        logger.info(f"DynamoDB prewarm skipped: {e}")
+
+if PREWARM_DYNAMODB_ON_INIT and os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+    _prewarm_dynamodb(_get_table(TABLE_SENSOR_PLUG_MAPPING))
 
 # ---------- helpers ----------
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            # keep ints as int, floats as float
-            if obj % 1 == 0:
-                return int(obj)
-            return float(obj)
-        return super().default(obj)
+def _json_default(o):
+    if isinstance(o, Decimal):
+        # keep ints as int, floats as float
+        return int(o) if o % 1 == 0 else float(o)
+    raise TypeError(f"Object of type {o.__class__.__name__} is not JSON serializable")
+
+def _json_dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), default=_json_default)
+
+def _json_loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 def _json_response(status: int, body: Dict[str, Any]):
     # Basic CORS for browser calls
@@ -37,7 +75,7 @@ def _json_response(status: int, body: Dict[str, Any]):
             "Access-Control-Allow-Methods": "GET,OPTIONS",
             "Access-Control-Allow-Headers": "Content-Type,Authorization",
         },
-        "body": json.dumps(body, cls=DecimalEncoder),
+        "body": _json_dumps(body),
     }
 
 def _get_query_param(event: dict, name: str) -> str:
@@ -56,11 +94,32 @@ def _get_body_json(event: dict) -> dict:
         return {}
     if isinstance(body, str):
         try:
-            return json.loads(body)
+            return _json_loads(body)
         except Exception:
             return {}
     return body if isinstance(body, dict) else {}
 
+def query_user_mappings(user_id: str) -> list:
+    """All of a user's mappings from the user_id GSI, following LastEvaluatedKey past 1 MB pages."""
+    table = _get_table(TABLE_SENSOR_PLUG_MAPPING)
+    kwargs = {
+        "IndexName": MAPPING_GSI_USER_ID,
+        "KeyConditionExpression": "user_id = :u",
+        "ExpressionAttributeValues": {":u": user_id},
+        "Select": "SPECIFIC_ATTRIBUTES",
+        "ProjectionExpression": _MAPPING_PROJECTION,
+        "ExpressionAttributeNames": _MAPPING_ATTR_NAMES,
+    }
+    items = []
+    while True:
+        resp = table.query(**kwargs)
+        items.extend(resp.get("Items") or [])
+        lek = resp.get("LastEvaluatedKey")
+        if not lek:
+            break
+        kwargs["ExclusiveStartKey"] = lek
+    return items
+
 # handler
 def lambda_handler(event, context):
     # Preflight
@@ -72,11 +131,7 @@ def lambda_handler(event, context):
         SHARED_USER_ID = os.environ.get("SHARED_USER_ID", "qingping_shared").strip()
         user_id = SHARED_USER_ID
 
-        resp = mapping_table.query(
-            IndexName=MAPPING_GSI_USER_ID,
-            KeyConditionExpression=Key("user_id").eq(user_id),
-        )
-        items = resp.get("Items", []) or []
+        items = query_user_mappings(user_id)
 
         # Return clean fields for UI
         mappings = []
@@ -3,13 +3,21 @@ import json
 import time
 import base64
 import logging
+import threading
 from typing import Dict, Any
 
 import requests
-import boto3
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:  # not bundled with this deployment; use the stdlib codec
+    orjson = None
 
 logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+_LOG_LEVEL = logging.getLevelName(os.environ.get("LOG_LEVEL", "INFO").upper())
+# an unknown name comes back as a "Level X" string; fall back rather than fail INIT
+logger.setLevel(_LOG_LEVEL if isinstance(_LOG_LEVEL, int) else logging.INFO)
 
 # Qingping endpoints
 OAUTH_BASE = "https://oauth.cleargrass.com"
@@ -21,17 +29,57 @@ QINGPING_APP_SECRET = os.environ.get("QINGPING_APP_SECRET", "").strip()
 
 # DynamoDB
 DYNAMO_TABLE_DEVICES = os.environ.get("TABLE_QINGPING_DEVICES", "QingpingDevices")
-dynamodb = boto3.resource("dynamodb")
-devices_table = dynamodb.Table(DYNAMO_TABLE_DEVICES)
+dynamodb = None
+_TABLES = {}
+
+def _get_table(name: str):
+    # boto3 loads here, so requests rejected before the bind never import it
+    global dynamodb
+    table = _TABLES.get(name)
+    if table is None:
+        if dynamodb is None:
+            import boto3
+            dynamodb = boto3.resource("dynamodb")
+        table = _TABLES[name] = dynamodb.Table(name)
+    return table
+
+# opt-in: prime credentials + the DynamoDB connection at INIT rather than on the first bind,
+# at the cost of importing boto3 even for requests that fail validation
+PREWARM_DYNAMODB_ON_INIT = os.environ.get("PREWARM_DYNAMODB_ON_INIT", "false").lower() == "true"
+
+def _prewarm_dynamodb(table):
+    try:
+        table.get_item(Key={"sensor_mac": "__prewarm__"})
+    except Exception as e:
+        logger.info("DynamoDB prewarm skipped: %s", e)
+
+if PREWARM_DYNAMODB_ON_INIT and os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+    _prewarm_dynamodb(_get_table(DYNAMO_TABLE_DEVICES))
 
 # token cache (warm Lambda reuse)
-_TOKEN_CACHE = {"token": None, "expires_at": 0}
+_TOKEN_CACHE = {"token": None, "expires_at": 0, "refreshing": False}
+_TOKEN_LOCK = threading.Lock()
+_REFRESH_AHEAD_S = 600  # serve the old token but refresh it in the background this close to expiry
+
+# keep-alive session: warm invocations reuse the sockets to oauth./apis.cleargrass.com
+_HTTP = requests.Session()
+_HTTP.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=4))
+
+def _json_dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"))
+
+def _json_loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 def _json_response(status: int, body: Dict[str, Any]):
     return {
         "statusCode": status,
         "headers": {"Content-Type": "application/json"},
-        "body": json.dumps(body),
+        "body": _json_dumps(body),
     }
 
 def _get_event_body_json(event: dict) -> dict:
@@ -45,7 +93,7 @@ def _get_event_body_json(event: dict) -> dict:
         return {}
     if isinstance(body, str):
         try:
-            return json.loads(body)
+            return _json_loads(body)
         except Exception:
             return {}
     return body if isinstance(body, dict) else {}
@@ -53,12 +101,34 @@ def _get_event_body_json(event: dict) -> dict:
 def get_qingping_access_token() -> str:
     """
     OAuth2 Client Credentials flow.
-    Returns a bearer access token, cached until near expiry.
+    Returns a bearer access token, cached and refreshed in the background
+    during its last _REFRESH_AHEAD_S seconds.
     """
     now = int(time.time())
-    if _TOKEN_CACHE["token"] and now < _TOKEN_CACHE["expires_at"]:
-        return _TOKEN_CACHE["token"]
-
+    token = _TOKEN_CACHE["token"]
+    expires_at = _TOKEN_CACHE["expires_at"]
+    if token and now < expires_at:
+        if now > expires_at - _REFRESH_AHEAD_S:
+            _start_background_refresh()
+        return token
+    return _fetch_qingping_token(now)
+
+def _background_refresh():
+    try:
+        _fetch_qingping_token(int(time.time()))
+    except Exception as e:
+        logger.warning("Background Qingping token refresh failed: %s", e)
+    finally:
+        _TOKEN_CACHE["refreshing"] = False
+
+def _start_background_refresh():
+    with _TOKEN_LOCK:
+        if _TOKEN_CACHE["refreshing"]:
+            return
+        _TOKEN_CACHE["refreshing"] = True
+    threading.Thread(target=_background_refresh, daemon=True).start()
+
+def _fetch_qingping_token(now: int) -> str:
     if not QINGPING_APP_KEY or not QINGPING_APP_SECRET:
         raise RuntimeError("Missing QINGPING_APP_KEY or QINGPING_APP_SECRET env var")
 
@@ -75,8 +145,9 @@ def get_qingping_access_token() -> str:
         "scope": "device_full_access",
     }
 
-    r = requests.post(url, headers=headers, data=data, timeout=10)
-    logger.info("OAuth token response: %s", r.text)
+    r = _HTTP.post(url, headers=headers, data=data, timeout=10)
+    # the body carries the access token; only log it at DEBUG
+    logger.debug("OAuth token response: %s", r.text)
     r.raise_for_status()
 
     resp = r.json()
@@ -86,8 +157,9 @@ def get_qingping_access_token() -> str:
     if not token or expires_in <= 0:
         raise RuntimeError(f"Unexpected token response: {resp}")
 
-    _TOKEN_CACHE["token"] = token
-    _TOKEN_CACHE["expires_at"] = now + expires_in - 60  # refresh 60s early
+    with _TOKEN_LOCK:
+        _TOKEN_CACHE["token"] = token
+        _TOKEN_CACHE["expires_at"] = now + expires_in - 60  # refresh 60s early
     return token
 
 def bind_device(device_token: str, product_id: int) -> Dict[str, Any]:
@@ -105,8 +177,8 @@ def bind_device(device_token: str, product_id: int) -> Dict[str, Any]:
         "Content-Type": "application/json",
     }
 
-    r = requests.post(url, headers=headers, json=payload, timeout=10)
-    logger.info("Device bind response: %s", r.text)
+    r = _HTTP.post(url, headers=headers, json=payload, timeout=10)
+    logger.debug("Device bind response: %s", r.text)
     r.raise_for_status()
     return r.json()
 
@@ -127,7 +199,7 @@ def save_bound_device(user_id: str, result: dict):
         "enabled": True,
     }
 
-    devices_table.put_item(Item=item)
+    _get_table(DYNAMO_TABLE_DEVICES).put_item(Item=item)
 
 def lambda_handler(event, context):
     """
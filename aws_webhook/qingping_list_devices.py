@@ -3,13 +3,19 @@ import json
 import time
 import base64
 import logging
-import urllib.request
 import urllib.parse
-from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Any
 
 import boto3
-from boto3.dynamodb.conditions import Key
+import urllib3
+from botocore.config import Config
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+
+try:
+    import orjson
+except ImportError:  # not bundled with this deployment; use the stdlib codec
+    orjson = None
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -22,12 +28,72 @@ SHARED_USER_ID = os.environ.get("SHARED_USER_ID", "qingping_shared")
 QINGPING_CLIENT_ID = os.environ.get("QINGPING_APP_KEY")
 QINGPING_CLIENT_SECRET = os.environ.get("QINGPING_APP_SECRET")
 
+# Optional shared token cache (same table layout as tuya_common: partition key "cache_key")
+TOKEN_CACHE_TABLE = os.environ.get("TOKEN_CACHE_TABLE", "").strip()
+_TOKEN_CACHE_KEY = "token_cache#qingping"
+
 OAUTH_TOKEN_URL = "https://oauth.cleargrass.com/oauth2/token"
 QINGPING_DEVICES_API = "https://apis.cleargrass.com/v1/apis/devices"
 
+# constant per container, so encode the Basic credentials once
+_BASIC_AUTH = "Basic " + base64.b64encode(
+    f"{QINGPING_CLIENT_ID}:{QINGPING_CLIENT_SECRET}".encode()
+).decode()
+
+# attributes the Qingping API can change on an existing device and that every
+# QingpingDevices writer (webhook, bind, this sync) stores the same way; product
+# (the webhook keeps a subset) and bound_at (set to "now" by the others) are not
+_DEVICE_FIELDS = ("device_name", "version", "enabled")
+_DB_ATTR_NAMES = {f"#f{i}": name for i, name in enumerate(("sensor_mac",) + _DEVICE_FIELDS)}
+_DB_PROJECTION = ", ".join(_DB_ATTR_NAMES)
+
 # ---------- AWS ----------
-dynamodb = boto3.resource("dynamodb")
-devices_table = dynamodb.Table(TABLE_QINGPING_DEVICES)
+# every sync talks to DynamoDB, so boto3 is imported eagerly and warmed at INIT below.
+# One low-level client for everything: no Resource translation layer, keep-alive sockets
+# that survive gaps between invocations, and a pool sized for the write executor below
+_ddb_client = boto3.client(
+    "dynamodb",
+    config=Config(
+        tcp_keepalive=True,
+        max_pool_connections=16,
+        retries={"mode": "adaptive", "total_max_attempts": 5},
+    ),
+)
+_serialize = TypeSerializer().serialize
+_deserialize = TypeDeserializer().deserialize
+
+def _from_ddb(item: dict) -> dict:
+    return {k: _deserialize(v) for k, v in item.items()}
+
+# BatchWriteItem requests of one sync run concurrently
+_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# prime credentials + the DynamoDB connection at INIT rather than on the first sync
+PREWARM_ON_INIT = os.environ.get("PREWARM_ON_INIT", "true").lower() == "true"
+
+def _prewarm_dynamodb():
+    try:
+        _ddb_client.get_item(TableName=TABLE_QINGPING_DEVICES, Key={"sensor_mac": {"S": "__prewarm__"}})
+    except Exception as e:
+        logger.info(f"DynamoDB prewarm skipped: {e}")
+
+if PREWARM_ON_INIT and os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+    _prewarm_dynamodb()
+
+# ---------- HTTP ----------
+# pooled keep-alive connections to oauth. and apis.cleargrass.com, reused across warm invocations
+_HTTP = urllib3.PoolManager(
+    num_pools=2,
+    maxsize=4,
+    retries=urllib3.Retry(3, backoff_factor=0.2),
+    timeout=20.0,
+)
+
+def _http_json(method: str, url: str, headers: dict, body=None, **request_kw) -> dict:
+    resp = _HTTP.request(method, url, body=body, headers=headers, **request_kw)
+    if resp.status >= 400:
+        raise RuntimeError(f"HTTP {resp.status} from {url}: {resp.data.decode('utf-8', 'replace')}")
+    return _json_loads(resp.data)
 
 # ---------- OAuth token cache (per Lambda container) ----------
 _TOKEN_CACHE = {
@@ -37,47 +103,96 @@ _TOKEN_CACHE = {
 
 # ---------- Helpers ----------
 def _json_default(o):
-    if isinstance(o, Decimal):
+    # checked by name so this module never has to import decimal itself
+    if type(o).__name__ == "Decimal":
         return int(o) if o % 1 == 0 else float(o)
     raise TypeError()
 
+def _json_dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), default=_json_default)
+
+def _json_loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 def _json_response(status: int, body: Dict[str, Any]):
     return {
         "statusCode": status,
         "headers": {"Content-Type": "application/json"},
-        "body": json.dumps(body, default=_json_default),
+        "body": _json_dumps(body),
     }
 
 # ---------- OAuth ----------
-def get_qingping_access_token() -> str:
+def _read_shared_token(now: float):
+    resp = _ddb_client.get_item(
+        TableName=TOKEN_CACHE_TABLE, Key={"cache_key": {"S": _TOKEN_CACHE_KEY}}, ConsistentRead=True
+    )
+    item = _from_ddb(resp.get("Item") or {})
+    token = item.get("access_token")
+    expires_at = int(item.get("expires_at", 0))
+    if token and now < expires_at:
+        return token, expires_at
+    return None
+
+def _write_shared_token(token: str, expires_at: int, now: float):
+    """
+    Stores the token unless another container already stored a live one,
+    in which case that one is returned and used instead.
+    """
+    client = _ddb_client
+    try:
+        client.put_item(
+            TableName=TOKEN_CACHE_TABLE,
+            Item={
+                "cache_key": {"S": _TOKEN_CACHE_KEY},
+                "access_token": {"S": token},
+                "expires_at": {"N": str(expires_at)},
+            },
+            ConditionExpression="attribute_not_exists(expires_at) OR expires_at < :now",
+            ExpressionAttributeValues={":now": {"N": str(int(now))}},
+        )
+        return None
+    except client.exceptions.ConditionalCheckFailedException:
+        return _read_shared_token(now)
+
+def get_qingping_access_token(**request_kw) -> str:
+    """request_kw (e.g. retries, timeout) are passed to the OAuth request only."""
     now = time.time()
 
     # Reuse token if still valid
     if _TOKEN_CACHE["access_token"] and now < _TOKEN_CACHE["expires_at"]:
         return _TOKEN_CACHE["access_token"]
 
-    auth = base64.b64encode(
-        f"{QINGPING_CLIENT_ID}:{QINGPING_CLIENT_SECRET}".encode()
-    ).decode()
+    # then one a previous container left in the shared table
+    if TOKEN_CACHE_TABLE:
+        try:
+            shared = _read_shared_token(now)
+        except Exception as e:
+            logger.warning(f"Shared Qingping token read failed (continuing): {e}")
+            shared = None
+        if shared:
+            _TOKEN_CACHE["access_token"], _TOKEN_CACHE["expires_at"] = shared
+            return shared[0]
 
     data = urllib.parse.urlencode({
         "grant_type": "client_credentials",
         "scope": "device_full_access",
-    }).encode()
+    })
 
-    req = urllib.request.Request(
+    payload = _http_json(
+        "POST",
         OAUTH_TOKEN_URL,
-        data=data,
-        method="POST",
         headers={
-            "Authorization": f"Basic {auth}",
+            "Authorization": _BASIC_AUTH,
             "Content-Type": "application/x-www-form-urlencoded",
         },
+        body=data,
+        **request_kw,
     )
 
-    with urllib.request.urlopen(req, timeout=20) as resp:
-        payload = json.loads(resp.read().decode())
-
     token = payload.get("access_token")
     expires_in = int(payload.get("expires_in", 7200))
 
@@ -85,29 +200,44 @@ def get_qingping_access_token() -> str:
         raise RuntimeError("Failed to obtain Qingping access token")
 
     # Cache token (refresh 60s early)
+    expires_at = int(now + expires_in - 60)
+    if TOKEN_CACHE_TABLE:
+        try:
+            stored = _write_shared_token(token, expires_at, now)
+        except Exception as e:
+            logger.warning(f"Shared Qingping token write failed (continuing): {e}")
+            stored = None
+        if stored:
+            token, expires_at = stored
+
     _TOKEN_CACHE["access_token"] = token
-    _TOKEN_CACHE["expires_at"] = now + expires_in - 60
+    _TOKEN_CACHE["expires_at"] = expires_at
 
     logger.info("Fetched new Qingping OAuth token")
     return token
 
+# fetch the token during INIT too, which also opens the pooled connection to the OAuth host;
+# one short attempt only, so a slow OAuth host cannot push INIT past its 10 s limit
+if PREWARM_ON_INIT and os.environ.get("AWS_LAMBDA_FUNCTION_NAME") and QINGPING_CLIENT_ID:
+    try:
+        get_qingping_access_token(retries=False, timeout=2.0)
+    except Exception as e:
+        logger.info(f"Qingping token prefetch skipped: {e}")
+
 # ---------- Qingping API ----------
 def fetch_qingping_devices() -> Dict[str, dict]:
     token = get_qingping_access_token()
 
     url = f"{QINGPING_DEVICES_API}?limit=50&offset=0&timestamp={int(time.time()*1000)}"
-    req = urllib.request.Request(
+    data = _http_json(
+        "GET",
         url,
         headers={
             "Authorization": f"Bearer {token}",
             "Accept": "application/json",
         },
-        method="GET",
     )
 
-    with urllib.request.urlopen(req, timeout=20) as resp:
-        data = json.loads(resp.read().decode())
-
     devices = {}
     for d in data.get("devices", []):
         info = d.get("info", {})
@@ -128,11 +258,104 @@ def fetch_qingping_devices() -> Dict[str, dict]:
     return devices
 
 def fetch_db_devices() -> Dict[str, dict]:
-    resp = devices_table.query(
+    # the paginator follows LastEvaluatedKey; stopping at the first 1 MB page would look like deleted devices
+    pages = _ddb_client.get_paginator("query").paginate(
+        TableName=TABLE_QINGPING_DEVICES,
         IndexName=DEVICES_GSI_USER_ID,
-        KeyConditionExpression=Key("user_id").eq(SHARED_USER_ID),
+        KeyConditionExpression="user_id = :u",
+        ExpressionAttributeValues={":u": {"S": SHARED_USER_ID}},
+        # MACs only; fields for the change check come from fetch_db_device_fields
+        Select="SPECIFIC_ATTRIBUTES",
+        ProjectionExpression="#mac",
+        ExpressionAttributeNames={"#mac": "sensor_mac"},
+        PaginationConfig={"PageSize": 1000},
+    )
+    devices = {}
+    for page in pages:
+        for it in page.get("Items") or []:
+            mac = it["sensor_mac"]["S"]
+            devices[mac] = {"sensor_mac": mac}
+    return devices
+
+def _changed_fields(fresh: dict, stored: dict) -> Dict[str, Any]:
+    # DynamoDB numbers come back as Decimal, which compares equal to the API's ints
+    return {k: fresh.get(k) for k in _DEVICE_FIELDS if fresh.get(k) != stored.get(k)}
+
+def _batch_write(writes: list):
+    """
+    One BatchWriteItem (<= 25 requests).
+    UnprocessedItems are retried with exponential backoff.
+    """
+    request = {TABLE_QINGPING_DEVICES: writes}
+    attempt = 0
+    while request:
+        resp = _ddb_client.batch_write_item(RequestItems=request)
+        request = resp.get("UnprocessedItems") or {}
+        if request:
+            if attempt >= 5:
+                raise RuntimeError(f"BatchWriteItem left {len(request[TABLE_QINGPING_DEVICES])} items unprocessed")
+            time.sleep(0.05 * (2 ** attempt))
+            attempt += 1
+
+def _update_device(mac: str, fields: Dict[str, Any]):
+    """
+    SETs only the given attributes of an existing device. A whole-item put would
+    drop what the other writers store (last_seen_at, connection_type, created_at).
+    """
+    names = {f"#f{i}": k for i, k in enumerate(fields)}
+    values = {f":v{i}": _serialize(v) for i, v in enumerate(fields.values())}
+    _ddb_client.update_item(
+        TableName=TABLE_QINGPING_DEVICES,
+        Key={"sensor_mac": {"S": mac}},
+        UpdateExpression="SET " + ", ".join(f"#f{i} = :v{i}" for i in range(len(fields))),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
     )
-    return {it["sensor_mac"]: it for it in resp.get("Items", [])}
+
+def write_device_changes(puts: list, updates: Dict[str, Dict[str, Any]], deletes: list):
+    serialize = _serialize
+
+    writes = [{"PutRequest": {"Item": {k: serialize(v) for k, v in item.items()}}} for item in puts]
+    writes.extend({"DeleteRequest": {"Key": {"sensor_mac": {"S": mac}}}} for mac in deletes)
+    chunks = [writes[i:i + 25] for i in range(0, len(writes), 25)]
+    if len(chunks) + len(updates) <= 1:
+        for chunk in chunks:
+            _batch_write(chunk)
+        for mac, fields in updates.items():
+            _update_device(mac, fields)
+        return
+    futures = [_EXECUTOR.submit(_batch_write, chunk) for chunk in chunks]
+    futures.extend(_EXECUTOR.submit(_update_device, mac, fields) for mac, fields in updates.items())
+    for f in as_completed(futures):
+        f.result()
+
+def fetch_db_device_fields(macs) -> Dict[str, dict]:
+    """
+    BatchGetItem of the compared fields for the given MACs, 100 keys per request.
+    UnprocessedKeys are retried with exponential backoff.
+    """
+    out: Dict[str, dict] = {}
+    macs = list(macs)
+    for i in range(0, len(macs), 100):
+        request = {
+            TABLE_QINGPING_DEVICES: {
+                "Keys": [{"sensor_mac": {"S": m}} for m in macs[i:i + 100]],
+                "ProjectionExpression": _DB_PROJECTION,
+                "ExpressionAttributeNames": _DB_ATTR_NAMES,
+            }
+        }
+        attempt = 0
+        while request:
+            resp = _ddb_client.batch_get_item(RequestItems=request)
+            for it in resp.get("Responses", {}).get(TABLE_QINGPING_DEVICES, []):
+                out[it["sensor_mac"]["S"]] = _from_ddb(it)
+            request = resp.get("UnprocessedKeys") or {}
+            if request:
+                if attempt >= 5:
+                    raise RuntimeError(f"BatchGetItem left {len(request[TABLE_QINGPING_DEVICES]['Keys'])} keys unprocessed")
+                time.sleep(0.05 * (2 ** attempt))
+                attempt += 1
+    return out
 
 # ---------- Lambda ----------
 def lambda_handler(event, context):
@@ -140,25 +363,42 @@ def lambda_handler(event, context):
         qingping_devices = fetch_qingping_devices()
         db_devices = fetch_db_devices()
 
-        qingping_macs = set(qingping_devices.keys())
-        db_macs = set(db_devices.keys())
-
-        # Add new devices
-        for mac in qingping_macs - db_macs:
-            devices_table.put_item(Item=qingping_devices[mac])
+        # dict key views support set operations directly; sorted keeps writes and logs in MAC order
+        qingping_macs = qingping_devices.keys()
+        added = sorted(qingping_macs - db_devices.keys())
+        removed = sorted(db_devices.keys() - qingping_macs)
+        # devices present on both sides get only their changed attributes updated
+        common = sorted(qingping_macs & db_devices.keys())
+        stored = fetch_db_device_fields(common) if common else {}
+        updates = {}
+        for mac in common:
+            fields = _changed_fields(qingping_devices[mac], stored.get(mac, {}))
+            if fields:
+                updates[mac] = fields
+        changed = list(updates)
+
+        # Add new devices and remove deleted ones 25 per BatchWriteItem; batches and updates run in parallel
+        write_device_changes([qingping_devices[mac] for mac in added], updates, removed)
+        for mac in added:
             logger.info(f"Added device {mac}")
-
-        # Remove deleted devices
-        for mac in db_macs - qingping_macs:
-            devices_table.delete_item(Key={"sensor_mac": mac})
+        for mac in changed:
+            logger.info(f"Updated device {mac}")
+        for mac in removed:
             logger.info(f"Removed device {mac}")
 
-        return _json_response(200, {
+        body = {
             "status": "ok",
             "user_id": SHARED_USER_ID,
             "count": len(qingping_devices),
-            "devices": list(qingping_devices.values()),
-        })
+            "added": added,
+            "updated": changed,
+            "removed": removed,
+        }
+        # the full list is opt-in; scheduled syncs only need the diff
+        qsp = (event or {}).get("queryStringParameters") or {}
+        if str(qsp.get("include_devices", "")).lower() == "true":
+            body["devices"] = list(qingping_devices.values())
+        return _json_response(200, body)
 
     except Exception as e:
         logger.exception("Qingping sync failed")
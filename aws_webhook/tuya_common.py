@@ -0,0 +1,268 @@
+# tuya_common.py
+"""
+Tuya OpenAPI signing, requests and access-token cache shared by the aws_webhook Lambdas.
+
+Deploy it next to each handler's lambda_function.py or in a Lambda layer
+(python/tuya_common.py). When TOKEN_CACHE_TABLE is set, the access token is
+also stored in DynamoDB so cold-started containers reuse a live token instead
+of calling /v1.0/token each time.
+"""
+import os
+import json
+import time
+import hmac
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional
+from urllib.parse import urlencode
+
+import urllib3
+
+try:
+    import orjson
+except ImportError:  # not bundled with this deployment; use the stdlib codec
+    orjson = None
+
+logger = logging.getLogger()
+
+# ---------- ENV ----------
+TUYA_ACCESS_ID = os.environ.get("TUYA_ACCESS_ID", "").strip()
+TUYA_ACCESS_SECRET = os.environ.get("TUYA_ACCESS_SECRET", "").strip()
+TUYA_BASE_URL = os.environ.get("TUYA_BASE_URL", "https://openapi.tuyaus.com").strip()
+
+# Optional shared token cache: a table whose partition key is the string "cache_key"
+TOKEN_CACHE_TABLE = os.environ.get("TOKEN_CACHE_TABLE", "").strip()
+_TOKEN_CACHE_KEY = "token_cache#tuya"
+
+_TUYA_ID_BYTES = TUYA_ACCESS_ID.encode("utf-8")
+_TUYA_SECRET_BYTES = TUYA_ACCESS_SECRET.encode("utf-8")
+_EMPTY_SHA256_HEX = hashlib.sha256(b"").hexdigest()
+# keyed once: copy() reuses the derived inner/outer pads instead of re-keying per request
+_TUYA_HMAC_BASE = hmac.new(_TUYA_SECRET_BYTES, digestmod=hashlib.sha256)
+
+# Token cache (per container)
+_TUYA_TOKEN_CACHE = {"token": None, "expires_at": 0, "refreshing": False}
+_TOKEN_LOCK = threading.Lock()
+
+# inside this window a valid token is still served, and a background refresh replaces it
+_REFRESH_AHEAD_S = 600
+
+# pooled HTTP client (urllib3 ships with boto3 in the Lambda runtime)
+_POOL = urllib3.PoolManager(num_pools=2, maxsize=10)
+
+_token_table = None
+
+# INIT-time warm-up: open the TLS connection to Tuya before the first billed request
+PREWARM_TUYA_ON_INIT = os.environ.get("PREWARM_TUYA_ON_INIT", "true").lower() == "true"
+
+def _prewarm_http():
+    try:
+        # any status will do; the point is the handshake, which the pool then keeps
+        _POOL.request("HEAD", TUYA_BASE_URL + "/", timeout=2.0, retries=False)
+    except Exception as e:
+        logger.info(f"Tuya connection prewarm skipped: {e}")
+
+if PREWARM_TUYA_ON_INIT and os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+    _prewarm_http()
+
+# ---------- Helpers ----------
+# also the codec of the Lambdas that import this module; default= handles e.g. Decimal
+def _json_dumps(obj, default=None) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=default).decode("utf-8")
+    # ensure_ascii=False matches orjson, which writes non-ASCII text as UTF-8
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default)
+
+def _json_loads(raw):
+    # str or bytes: orjson takes either, so base64-decoded webhook bodies need no extra decode
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def _nonce() -> str:
+    # Tuya only needs a unique per-request string, not an RFC 4122 UUID
+    return os.urandom(16).hex()
+
+def _sha256_hex(s: str) -> str:
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+def _build_canonical_query(query: Optional[Dict[str, Any]]) -> str:
+    if not query:
+        return ""
+    cleaned = {k: v for k, v in query.items() if v is not None and str(v) != ""}
+    return urlencode(sorted(cleaned.items()), doseq=True)
+
+def _tuya_sign(method: str, path_with_query: str, body_str: str, access_token: str, t_ms: str, nonce: str) -> str:
+    content_sha256 = _sha256_hex(body_str) if body_str else _EMPTY_SHA256_HEX
+    string_to_sign = f"{method.upper()}\n{content_sha256}\n\n{path_with_query}"
+    h = _TUYA_HMAC_BASE.copy()
+    h.update(b"".join((
+        _TUYA_ID_BYTES,
+        access_token.encode("utf-8"),
+        t_ms.encode("ascii"),
+        nonce.encode("ascii"),
+        string_to_sign.encode("utf-8"),
+    )))
+    return h.hexdigest().upper()
+
+def _http_json(method: str, url: str, headers: dict, body_str: str = "") -> dict:
+    data = body_str.encode("utf-8") if body_str else None
+    try:
+        resp = _POOL.request(method.upper(), url, body=data, headers=headers, timeout=20.0)
+    except urllib3.exceptions.HTTPError as e:
+        raise RuntimeError({"http": "url_error", "body": str(e)})
+    if resp.status >= 400:
+        raise RuntimeError({"http": resp.status, "body": resp.data.decode("utf-8", "replace")})
+    return _json_loads(resp.data) if resp.data else {}
+
+# ---------- Tuya API ----------
+def tuya_request(
+    method: str,
+    path: str,
+    token: str = "",
+    query: Optional[Dict[str, Any]] = None,
+    body: Optional[Dict[str, Any]] = None,
+    *,
+    canonical_qs: Optional[str] = None,
+    check_success: bool = True,
+) -> dict:
+    """
+    canonical_qs, when given, is used verbatim instead of building one from query;
+    it must already be sorted and urlencoded the way _build_canonical_query does.
+    check_success=False returns Tuya's {"success": false, ...} body instead of raising.
+    """
+    if not TUYA_ACCESS_ID or not TUYA_ACCESS_SECRET:
+        raise RuntimeError("Missing TUYA_ACCESS_ID or TUYA_ACCESS_SECRET")
+
+    method = method.upper()
+    body_str = _json_dumps(body) if body else ""
+    t_ms = str(int(time.time() * 1000))
+    nonce = _nonce()
+
+    qs = canonical_qs if canonical_qs is not None else _build_canonical_query(query)
+    path_with_query = path + (f"?{qs}" if qs else "")
+
+    sign = _tuya_sign(method, path_with_query, body_str, token, t_ms, nonce)
+
+    headers = {
+        "client_id": TUYA_ACCESS_ID,
+        "sign": sign,
+        "t": t_ms,
+        "nonce": nonce,
+        "sign_method": "HMAC-SHA256",
+    }
+    if token:
+        headers["access_token"] = token
+    if body:
+        headers["Content-Type"] = "application/json"
+
+    url = TUYA_BASE_URL + path_with_query
+    data = _http_json(method, url, headers=headers, body_str=body_str)
+
+    if check_success and isinstance(data, dict) and data.get("success") is False:
+        raise RuntimeError(data)
+
+    return data
+
+# ---------- Shared token cache ----------
+def _get_token_table():
+    global _token_table
+    if _token_table is None:
+        import boto3
+        _token_table = boto3.resource("dynamodb").Table(TOKEN_CACHE_TABLE)
+    return _token_table
+
+def _read_shared_token(now: float) -> Optional[tuple]:
+    resp = _get_token_table().get_item(Key={"cache_key": _TOKEN_CACHE_KEY}, ConsistentRead=True)
+    item = resp.get("Item") or {}
+    token = item.get("access_token")
+    expires_at = int(item.get("expires_at", 0))
+    if token and now < expires_at:
+        return token, expires_at
+    return None
+
+def _write_shared_token(token: str, expires_at: int, now: float) -> Optional[tuple]:
+    """
+    Stores the token unless another container already stored a live one;
+    in that case the stored token is returned so everyone converges on it.
+    """
+    table = _get_token_table()
+    try:
+        table.put_item(
+            Item={"cache_key": _TOKEN_CACHE_KEY, "access_token": token, "expires_at": expires_at},
+            # never replace a token that outlives this one
+            ConditionExpression="attribute_not_exists(expires_at) OR expires_at < :exp",
+            ExpressionAttributeValues={":exp": expires_at},
+        )
+        return None
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        return _read_shared_token(now)
+
+def _fetch_tuya_token(now: float, min_valid_s: int = 0) -> str:
+    """
+    Gets a token from the shared table or /v1.0/token and stores it in the cache.
+    A shared token is only adopted if it stays valid for min_valid_s more seconds.
+    """
+    if TOKEN_CACHE_TABLE:
+        try:
+            shared = _read_shared_token(now + min_valid_s)
+        except Exception as e:
+            logger.warning(f"Shared Tuya token read failed (continuing): {e}")
+            shared = None
+        if shared:
+            with _TOKEN_LOCK:
+                _TUYA_TOKEN_CACHE["token"], _TUYA_TOKEN_CACHE["expires_at"] = shared
+            return shared[0]
+
+    data = tuya_request("GET", "/v1.0/token", token="", query={"grant_type": 1})
+    result = data.get("result") or {}
+    token = result.get("access_token")
+    expire_seconds = int(result.get("expire_time", 7200))
+
+    if not token:
+        raise RuntimeError({"msg": "token missing in response", "resp": data})
+
+    # refresh 60s early
+    expires_at = int(now + expire_seconds - 60)
+
+    if TOKEN_CACHE_TABLE:
+        try:
+            stored = _write_shared_token(token, expires_at, now)
+        except Exception as e:
+            logger.warning(f"Shared Tuya token write failed (continuing): {e}")
+            stored = None
+        if stored:
+            token, expires_at = stored
+
+    with _TOKEN_LOCK:
+        _TUYA_TOKEN_CACHE["token"] = token
+        _TUYA_TOKEN_CACHE["expires_at"] = expires_at
+    return token
+
+def _background_refresh():
+    try:
+        _fetch_tuya_token(time.time(), min_valid_s=_REFRESH_AHEAD_S)
+    except Exception as e:
+        logger.warning(f"Background Tuya token refresh failed: {e}")
+    finally:
+        _TUYA_TOKEN_CACHE["refreshing"] = False
+
+def _start_background_refresh():
+    with _TOKEN_LOCK:
+        if _TUYA_TOKEN_CACHE["refreshing"]:
+            return
+        _TUYA_TOKEN_CACHE["refreshing"] = True
+    # if the container freezes mid-refresh it simply resumes on the next invocation;
+    # the current token is still valid for up to _REFRESH_AHEAD_S meanwhile
+    threading.Thread(target=_background_refresh, daemon=True).start()
+
+def get_tuya_token() -> str:
+    now = time.time()
+    token = _TUYA_TOKEN_CACHE["token"]
+    expires_at = _TUYA_TOKEN_CACHE["expires_at"]
+    if token and now < expires_at:
+        if now > expires_at - _REFRESH_AHEAD_S:
+            _start_background_refresh()
+        return token
+    return _fetch_tuya_token(now)
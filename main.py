@@ -1,11 +1,10 @@
-import json
+from src.config import load_credentials
 from src.oauth import get_access_token
 from src.device_api import get_device_list
 
 def main():
-    with open("config/credentials.json") as f:
-        creds = json.load(f)
-    
+    creds = load_credentials()
+
     app_key = creds["APP_KEY"]
     app_secret = creds["APP_SECRET"]
 
@@ -0,0 +1,34 @@
+import json
+import os
+from functools import lru_cache
+
+# load config from /config/credentials.json when nothing else provides it
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+CONFIG_PATH = os.path.join(BASE_DIR, "config", "credentials.json")
+
+# e.g. "/qingping" -> parameters /qingping/app_key and /qingping/app_secret (SecureString)
+SSM_PREFIX = os.environ.get("QINGPING_SSM_PREFIX", "").strip().rstrip("/")
+
+def _from_ssm(prefix: str) -> dict:
+    import boto3
+    names = {f"{prefix}/app_key": "APP_KEY", f"{prefix}/app_secret": "APP_SECRET"}
+    resp = boto3.client("ssm").get_parameters(Names=list(names), WithDecryption=True)
+    if resp.get("InvalidParameters"):
+        raise RuntimeError(f"Missing SSM parameters: {resp['InvalidParameters']}")
+    return {names[p["Name"]]: p["Value"] for p in resp["Parameters"]}
+
+@lru_cache(maxsize=None)
+def load_credentials() -> dict:
+    """
+    Qingping APP_KEY / APP_SECRET, read once per process from the first source that has them:
+    QINGPING_APP_KEY + QINGPING_APP_SECRET env vars, SSM Parameter Store under
+    QINGPING_SSM_PREFIX, then config/credentials.json.
+    """
+    key = os.environ.get("QINGPING_APP_KEY")
+    secret = os.environ.get("QINGPING_APP_SECRET")
+    if key and secret:
+        return {"APP_KEY": key, "APP_SECRET": secret}
+    if SSM_PREFIX:
+        return _from_ssm(SSM_PREFIX)
+    with open(CONFIG_PATH, "r") as f:
+        return json.load(f)
@@ -1,6 +1,12 @@
-import requests
 import time
 import json
+from functools import lru_cache
+
+@lru_cache(maxsize=None)
+def _session():
+    """Keep-alive session for apis.cleargrass.com; requests is imported on the first call."""
+    import requests
+    return requests.Session()
 
 def get_device_list(access_token: str):
     """Fetch list of devices bound to your Qingping account."""
@@ -8,7 +14,7 @@ def get_device_list(access_token: str):
     url = f"https://apis.cleargrass.com/v1/apis/devices?timestamp={timestamp}"
     headers = {"Authorization": f"Bearer {access_token}"}
 
-    response = requests.get(url, headers=headers)
+    response = _session().get(url, headers=headers)
     if response.status_code != 200:
         raise Exception(f"Failed to fetch devices: {response.text}")
 
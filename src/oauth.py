@@ -1,8 +1,48 @@
-import requests
 import base64
+import json
+import os
+import time
+from functools import lru_cache
+
+# tokens survive between CLI runs here, like the Lambdas' in-memory _TOKEN_CACHE
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "qingping", "token.json")
+
+@lru_cache(maxsize=None)
+def _session():
+    """Session reused across token requests, built lazily so importing this module stays cheap."""
+    import requests
+    return requests.Session()
+
+def _read_cached_token(app_key: str):
+    try:
+        with open(CACHE_PATH, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # valid JSON of the wrong shape is as unusable as a corrupt file
+    if not isinstance(cache, dict):
+        return None
+    expires_at = cache.get("expires_at", 0)
+    if cache.get("app_key") == app_key and isinstance(expires_at, (int, float)) and expires_at > time.time():
+        return cache.get("access_token")
+    return None
+
+def _write_cached_token(app_key: str, token: str, expires_at: float):
+    try:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        # owner-only: the file holds a live bearer token
+        fd = os.open(CACHE_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"app_key": app_key, "access_token": token, "expires_at": expires_at}, f)
+    except OSError:
+        pass  # caching is best effort
 
 def get_access_token(app_key: str, app_secret: str) -> str:
-    """Obtain OAuth 2.0 access token from Qingping."""
+    """Obtain OAuth 2.0 access token from Qingping, reusing a cached one until shortly before it expires."""
+    cached = _read_cached_token(app_key)
+    if cached:
+        return cached
+
     url = "https://oauth.cleargrass.com/oauth2/token"
     auth_header = base64.b64encode(f"{app_key}:{app_secret}".encode()).decode()
     
@@ -15,10 +55,14 @@ def get_access_token(app_key: str, app_secret: str) -> str:
         "scope": "device_full_access"
     }
 
-    response = requests.post(url, headers=headers, data=data)
+    response = _session().post(url, headers=headers, data=data)
     if response.status_code != 200:
         raise Exception(f"Failed to get token: {response.text}")
 
-    token = response.json().get("access_token")
+    body = response.json()
+    token = body.get("access_token")
+    if token:
+        # refresh 60s early
+        _write_cached_token(app_key, token, time.time() + int(body.get("expires_in", 7200)) - 60)
     print("Access token acquired successfully.")
     return token
\ No newline at end of file
@@ -1,23 +1,52 @@
-from flask import Flask, request, jsonify
-import json, hmac, hashlib, os
+"""
+Local Qingping webhook receiver.
 
-# load config from /config/credentials.json
-BASE_DIR = os.path.dirname(os.path.dirname(__file__))
-CONFIG_PATH = os.path.join(BASE_DIR, "config", "credentials.json")
+Development:  python -m src.webhook_server
+Production:   gunicorn -k gthread -w 4 --threads 8 -b 0.0.0.0:5050 src.webhook_server:app
+"""
+from flask import Flask, request
+import json, hmac, hashlib, os, logging
 
-with open(CONFIG_PATH, "r") as f:
-    creds = json.load(f)
+from src.config import load_credentials
 
-APP_SECRET = creds["APP_SECRET"]
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib codec
+    orjson = None
+
+logger = logging.getLogger(__name__)
+_LOG_LEVEL = logging.getLevelName(os.environ.get("LOG_LEVEL", "INFO").upper())
+# unknown names fall back to INFO instead of failing at startup
+logging.basicConfig(level=_LOG_LEVEL if isinstance(_LOG_LEVEL, int) else logging.INFO)
+
+# fetched once at startup (env, SSM or config/credentials.json)
+APP_SECRET = load_credentials()["APP_SECRET"]
+_APP_SECRET_BYTES = APP_SECRET.encode()
+# keyed once; each request copies it instead of re-deriving the HMAC pads
+_HMAC_TEMPLATE = hmac.new(_APP_SECRET_BYTES, None, hashlib.sha256)
 
 app = Flask(__name__)
 
+def _json_loads(raw: bytes):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def _json_dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+def _respond(body: dict, status: int):
+    return app.response_class(_json_dumps(body), status=status, mimetype="application/json")
+
 @app.route("/qingping-webhook", methods=["POST"])
 def receive_data():
     try:
-        payload = request.get_json()
-        print("\nIncoming Data:")
-        print(json.dumps(payload, indent=2, ensure_ascii=False))
+        payload = _json_loads(request.get_data(cache=False))
+        # compact, and only serialized when DEBUG is on; it already includes the sensor data
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Payload: %s", _json_dumps(payload).decode())
 
         # extract signature block
         sig_data = payload.get("signature", {})
@@ -25,30 +54,34 @@ def receive_data():
         timestamp = str(sig_data.get("timestamp", ""))
         signature = sig_data.get("signature", "")
 
-        # verify authenticity using HMAC SHA256
-        expected_sig = hmac.new(
-            APP_SECRET.encode(),
-            (timestamp + token).encode(),
-            hashlib.sha256
-        ).hexdigest()
+        # verify authenticity using HMAC SHA256 (two updates, no joined string)
+        mac = _HMAC_TEMPLATE.copy()
+        mac.update(timestamp.encode())
+        mac.update(token.encode())
+        expected_sig = mac.hexdigest()
 
-        if signature != expected_sig:
-            print("Signature verification failed!")
-            return jsonify({"status": "unauthorized"}), 401
+        # constant-time compare; a non-str signature can never match
+        if not isinstance(signature, str) or not hmac.compare_digest(signature, expected_sig):
+            logger.warning("Signature verification failed!")
+            return _respond({"status": "unauthorized"}, 401)
 
         # extract sensor data
-        sensor_data = payload.get("payload", {}).get("data", [])
-        if sensor_data:
-            print("Parsed sensor data:")
-            print(json.dumps(sensor_data, indent=2))
-        else:
-            print("No sensor data found in payload.")
+        body = payload.get("payload", {})
+        sensor_data = body.get("data", [])
+        # structured fields instead of a pretty-printed dump
+        sensor_mac = body.get("info", {}).get("mac")
+        logger.info(
+            "Qingping webhook from %s: %d readings", sensor_mac, len(sensor_data),
+            extra={"sensor_mac": sensor_mac, "reading_count": len(sensor_data)},
+        )
+        if not sensor_data:
+            logger.info("No sensor data found in payload.")
 
-        return jsonify({"status": "ok"}), 200
+        return _respond({"status": "ok"}, 200)
 
     except Exception as e:
-        print("Error:", str(e))
-        return jsonify({"status": "error", "message": str(e)}), 500
+        logger.error("Error: %s", e)
+        return _respond({"status": "error", "message": str(e)}, 500)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+"""
+Round-trip of the CSV export's readings query against moto's in-memory DynamoDB.
+
+Run from the repo root: python -m unittest discover tests
+"""
+import importlib
+import os
+import sys
+import unittest
+
+import boto3
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aws_webhook"))
+
+try:
+    from moto import mock_aws
+except ImportError:  # moto is a test-only dependency
+    mock_aws = None
+
+MAC = "AABBCCDDEEFF"
+
+
+@unittest.skipIf(mock_aws is None, "moto is not installed")
+class QuerySensorReadingsTest(unittest.TestCase):
+    def setUp(self):
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        # the module builds its clients at import, so load it inside the mock
+        import download_sensor_and_plug_csv
+        self.mod = importlib.reload(download_sensor_and_plug_csv)
+
+        client = boto3.client("dynamodb")
+        client.create_table(
+            TableName=self.mod.SENSOR_READINGS_TABLE,
+            KeySchema=[
+                {"AttributeName": "sensor_mac", "KeyType": "HASH"},
+                {"AttributeName": "ts", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "sensor_mac", "AttributeType": "S"},
+                {"AttributeName": "ts", "AttributeType": "N"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        for ts in range(1700000000, 1700000050):
+            client.put_item(TableName=self.mod.SENSOR_READINGS_TABLE, Item={
+                "sensor_mac": {"S": MAC},
+                "ts": {"N": str(ts)},
+                "pm25": {"N": "12"},
+                "temperature": {"N": "21.5"},
+                "firmware": {"S": "not exported"},
+            })
+
+    def test_query_returns_projected_native_values(self):
+        items = self.mod.query_sensor_readings(MAC, 1700000000, 1700000049, page_size=20)
+
+        self.assertEqual(len(items), 50)
+        self.assertEqual(items[0], {"sensor_mac": MAC, "ts": 1700000000, "pm25": 12, "temperature": 21.5})
+        self.assertIs(type(items[0]["pm25"]), int)
+
+    def test_max_items_stops_paging(self):
+        items = self.mod.query_sensor_readings(MAC, 1700000000, 1700000049, page_size=20, max_items=25)
+
+        self.assertEqual([it["ts"] for it in items], list(range(1700000000, 1700000025)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Round-trips of the webhook Lambda's DynamoDB writes against moto's in-memory DynamoDB.
+
+Run from the repo root: python -m unittest discover tests
+"""
+import hashlib
+import hmac
+import json
+import os
+import sys
+from decimal import Decimal
+import unittest
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("QINGPING_APP_SECRET", "test-secret")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "aws_webhook"))
+
+try:
+    from moto import mock_aws
+except ImportError:  # moto is a test-only dependency
+    mock_aws = None
+
+import lambda_function  # noqa: E402
+
+MAC = "AABBCCDDEEFF"
+
+
+def _reading(ts, pm25=12):
+    return {
+        "timestamp": {"value": ts},
+        "pm25": {"value": pm25},
+        "pm10": {"value": 20},
+        "co2": {"value": 450},
+        "temperature": {"value": 21.5},
+        "humidity": {"value": 40},
+        "battery": {"value": 90},
+    }
+
+
+def _signed_event(readings):
+    ts, token = "1700000000", "tok"
+    sig = hmac.new(lambda_function._APP_SECRET_BYTES, (ts + token).encode(), hashlib.sha256).hexdigest()
+    return {"body": json.dumps({
+        "signature": {"timestamp": ts, "token": token, "signature": sig},
+        "payload": {"info": {"mac": MAC, "name": "office"}, "data": readings},
+    })}
+
+
+@unittest.skipIf(mock_aws is None, "moto is not installed")
+class SensorReadingWriteTest(unittest.TestCase):
+    def setUp(self):
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        # handles cached by earlier tests point at another mock
+        lambda_function._client = None
+        lambda_function.dynamodb = None
+        lambda_function._TABLES.clear()
+
+        client = lambda_function._get_client()
+        client.create_table(
+            TableName=lambda_function.TABLE_SENSOR_READINGS,
+            KeySchema=[
+                {"AttributeName": "sensor_mac", "KeyType": "HASH"},
+                {"AttributeName": "ts", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "sensor_mac", "AttributeType": "S"},
+                {"AttributeName": "ts", "AttributeType": "N"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        for name in (lambda_function.TABLE_SENSOR_PLUG_MAPPING, lambda_function.TABLE_QINGPING_DEVICES):
+            client.create_table(
+                TableName=name,
+                KeySchema=[{"AttributeName": "sensor_mac", "KeyType": "HASH"}],
+                AttributeDefinitions=[{"AttributeName": "sensor_mac", "AttributeType": "S"}],
+                BillingMode="PAY_PER_REQUEST",
+            )
+
+    def _stored_readings(self):
+        table = lambda_function._get_table(lambda_function.TABLE_SENSOR_READINGS)
+        return sorted(table.scan()["Items"], key=lambda it: it["ts"])
+
+    def test_single_reading(self):
+        resp = lambda_function.lambda_handler(_signed_event([_reading(1700000001)]), None)
+
+        self.assertEqual(resp["statusCode"], 200)
+        items = self._stored_readings()
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0]["sensor_mac"], MAC)
+        self.assertEqual(items[0]["ts"], 1700000001)
+        self.assertEqual(items[0]["temperature"], Decimal("21.5"))
+
+    def test_batch_keeps_the_last_reading_per_ts(self):
+        readings = [_reading(1700000001), _reading(1700000002), _reading(1700000001, pm25=30)]
+        resp = lambda_function.lambda_handler(_signed_event(readings), None)
+
+        self.assertEqual(resp["statusCode"], 200)
+        items = self._stored_readings()
+        self.assertEqual([it["ts"] for it in items], [1700000001, 1700000002])
+        self.assertEqual(items[0]["pm25"], 30)
+        self.assertTrue(all(it["sensor_mac"] == MAC for it in items))
+
+
+if __name__ == "__main__":
+    unittest.main()